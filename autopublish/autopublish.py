@@ -5,13 +5,36 @@ from core import checks
 from core.models import PermissionLevel
 
 
+def plan_stages(plan):
+    """Yield the stage names of an ``explain()`` query plan."""
+    stack = [plan]
+    while stack:
+        node = stack.pop()
+        if "stage" in node:
+            yield node["stage"]
+        if "inputStage" in node:
+            stack.append(node["inputStage"])
+        if "queryPlan" in node:
+            stack.append(node["queryPlan"])
+        stack.extend(node.get("inputStages", ()))
+
+
 class AutoPublish(commands.Cog):
     """Auto Publish messages sent in announcement channels"""
 
+    # Documents are looked up by guild ID stored as _id, which Mongo always indexes
+    db_indexes = []
+    # Queries run by the plugin at runtime, checked by `publishdbcheck`
+    db_hot_queries = [("tracked channels", {"_id": 0})]
+
     def __init__(self, bot):
         self.bot = bot
         self.coll = bot.plugin_db.get_partition(self)
 
+    async def cog_load(self):
+        for keys, options in self.db_indexes:
+            await self.coll.create_index(keys, **options)
+
     # Credit to codeinteger6 for this command's code
     @commands.command()
     @checks.has_permissions(PermissionLevel.MODERATOR)
@@ -95,6 +118,23 @@ class AutoPublish(commands.Cog):
                 "Not tracking any announcement channels in this server!"
             )
 
+    @commands.command()
+    @checks.has_permissions(PermissionLevel.ADMINISTRATOR)
+    async def publishdbcheck(self, ctx):
+        """Explain the plugin's database queries and flag collection scans"""
+        lines = []
+        for name, query in self.db_hot_queries:
+            plan = await self.coll.find(query).explain()
+            stages = list(plan_stages(plan["queryPlanner"]["winningPlan"]))
+            flag = "\u26a0\ufe0f" if "COLLSCAN" in stages else "\u2705"
+            lines.append(f"{flag} {name}: `{' <- '.join(stages)}`")
+        embed = discord.Embed(
+            title="Auto publish query plans",
+            description="\n".join(lines),
+            color=discord.Color.blue(),
+        )
+        return await ctx.send(embed=embed)
+
     @commands.Cog.listener()
     async def on_message(self, message):
         if not message.channel.is_news():
@@ -109,5 +149,5 @@ class AutoPublish(commands.Cog):
         await message.publish()
 
 
-def setup(bot):
-    bot.add_cog(AutoPublish(bot))
+async def setup(bot):
+    await bot.add_cog(AutoPublish(bot))
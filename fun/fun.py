@@ -1,11 +1,11 @@
+import asyncio
 import logging
+from collections import deque
 from enum import Enum
-from random import randint,choice
+from random import randint,choice,shuffle
 import discord
 from discord.ext import commands
-from dadjokes import Dadjoke
 from core import checks
-import box
 import json
 import string
 from core.models import PermissionLevel
@@ -53,8 +53,166 @@ class RPSParser:
             self.choice = RPS.scissors
         else:
             self.choice = None
+class MemePool:
+    """Reddit posts for the meme command, prefetched in the background.
+
+    The listing at ``url`` is fetched with ``fetch`` every ``ttl`` seconds and slimmed
+    down to the fields the command uses. Every channel walks its own shuffled order of
+    the pool, skipping posts it was already shown, so picking a post is O(1).
+    """
+
+    def __init__(self, fetch, url: str, ttl: int, retry_delay: int = 60):
+        self.fetch = fetch  # async (url) -> listing JSON, swap it to test against a local server
+        self.url = url
+        self.ttl = ttl
+        self.retry_delay = retry_delay
+        self.posts = []
+        self.version = 0  # bumped on every refresh
+        self.channels = {}  # channel id -> [pool version, remaining post indexes, shown post ids]
+        self.ready = asyncio.Event()
+        self.task = None
+
+    def start(self):
+        if self.task is None:
+            self.task = asyncio.create_task(self.run())
+
+    def stop(self):
+        if self.task is not None:
+            self.task.cancel()
+            self.task = None
+
+    async def run(self):
+        while True:
+            try:
+                await self.refresh()
+            except Exception as e:
+                # The previous pool keeps being served
+                logger.warning("Failed to refresh the meme pool: %s", e)
+            await asyncio.sleep(self.ttl if self.posts else self.retry_delay)
+
+    async def refresh(self):
+        listing = await self.fetch(self.url)
+        posts = []
+        for child in listing["data"]["children"]:
+            data = child["data"]
+            if data.get("stickied") or not data.get("url"):
+                continue
+            posts.append(
+                {
+                    "id": data["id"],
+                    "title": data["title"][:256],
+                    "url": data["url"],
+                    "ups": data.get("ups", 0),
+                    "downs": data.get("downs", 0),
+                }
+            )
+        if posts:
+            self.posts = posts
+            self.version += 1
+            self.ready.set()
+
+    def pick(self, channel_id: int):
+        """Returns a post not shown in the channel yet, or None while the pool is empty."""
+        if not self.posts:
+            return None
+        state = self.channels.get(channel_id)
+        if state is None or state[0] != self.version:
+            # Once per refresh, carry over what the channel saw that is still in the pool
+            ids = {post["id"] for post in self.posts}
+            shown = state[2] & ids if state is not None else set()
+            order = [idx for idx, post in enumerate(self.posts) if post["id"] not in shown]
+            shuffle(order)
+            state = [self.version, order, shown]
+            self.channels[channel_id] = state
+        if not state[1]:
+            # Everything was shown, start over
+            state[1] = list(range(len(self.posts)))
+            shuffle(state[1])
+            state[2] = set()
+        post = self.posts[state[1].pop()]
+        state[2].add(post["id"])
+        return post
+
+
+class JokeBuffer:
+    """A few dad jokes fetched ahead of time, so the command never waits on the API.
+
+    Taking a joke wakes the background refill, which tops the buffer up to ``size``.
+    While the buffer is empty, a joke from ``fallback`` is used instead.
+    """
+
+    def __init__(self, fetch, size: int, fallback: list, retry_delay: int = 60):
+        self.fetch = fetch  # async () -> joke text
+        self.size = size
+        self.fallback = fallback
+        self.retry_delay = retry_delay
+        self.jokes = deque(maxlen=size)
+        self.wanted = asyncio.Event()
+        self.task = None
+
+    def start(self):
+        if self.task is None:
+            self.wanted.set()
+            self.task = asyncio.create_task(self.run())
+
+    def stop(self):
+        if self.task is not None:
+            self.task.cancel()
+            self.task = None
+
+    async def run(self):
+        while True:
+            await self.wanted.wait()
+            self.wanted.clear()
+            while len(self.jokes) < self.size:
+                try:
+                    joke = await self.fetch()
+                except Exception as e:
+                    logger.warning("Failed to fetch a dad joke: %s", e)
+                    await asyncio.sleep(self.retry_delay)
+                    continue
+                if joke not in self.jokes:
+                    self.jokes.append(joke)
+
+    def take(self) -> str:
+        self.wanted.set()
+        if self.jokes:
+            return self.jokes.popleft()
+        return choice(self.fallback)
+
+
 class Fun(Cog):
     """Some Fun commands"""
+
+    meme_url = "https://www.reddit.com/r/dankmemes/top.json?sort=top&t=day&limit=100"
+    # Seconds between refreshes of the meme pool
+    meme_ttl = 900
+    dadjoke_url = "https://icanhazdadjoke.com/"
+    # Dad jokes kept ready for the dadjoke command
+    dadjoke_buffer_size = 10
+    # Used while no jokes could be fetched
+    offline_dadjokes = [
+        "I'm afraid for the calendar. Its days are numbered.",
+        "Why do fathers take an extra pair of socks when they go golfing? In case they get a hole in one!",
+        "Singing in the shower is fun until you get soap in your mouth. Then it's a soap opera.",
+        "What do a tick and the Eiffel Tower have in common? They're both Paris sites.",
+        "What do you call a fish wearing a bowtie? Sofishticated.",
+        "How do you follow Will Smith in the snow? You follow the fresh prints.",
+        "If April showers bring May flowers, what do May flowers bring? Pilgrims.",
+        "I thought the dryer was shrinking my clothes. Turns out it was the refrigerator all along.",
+        "How does dry skin affect you at work? You don't have any elbow grease to put into it.",
+        "What do you call a factory that makes okay products? A satisfactory.",
+        "Dear Math, grow up and solve your own problems.",
+        "What did the janitor say when he jumped out of the closet? Supplies!",
+        "Why do bees have sticky hair? Because they use honeycombs.",
+        "What kind of car does an egg drive? A yolkswagen.",
+        "I only know 25 letters of the alphabet. I don't know y.",
+        "Why did the scarecrow win an award? Because he was outstanding in his field.",
+        "I'm reading a book about anti-gravity. It's impossible to put down.",
+        "Did you hear about the restaurant on the moon? Great food, no atmosphere.",
+        "Want to hear a joke about construction? I'm still working on it.",
+        "I used to hate facial hair, but then it grew on me.",
+    ]
   
     ball = [
         "As I see it, yes",
@@ -82,6 +240,28 @@ class Fun(Cog):
         super().__init__()
         self.bot = bot
         #self.db = bot.plugin_db.get_partition(self)
+        self.memes = MemePool(self.fetch_json, self.meme_url, self.meme_ttl)
+        self.dadjokes = JokeBuffer(self.fetch_dadjoke, self.dadjoke_buffer_size, self.offline_dadjokes)
+
+    async def cog_load(self):
+        self.memes.start()
+        self.dadjokes.start()
+
+    async def cog_unload(self):
+        self.memes.stop()
+        self.dadjokes.stop()
+
+    async def fetch_json(self, url: str):
+        async with self.bot.session.get(url, headers={"User-Agent": "modmail-fun-plugin"}) as resp:
+            resp.raise_for_status()
+            return await resp.json()
+
+    async def fetch_dadjoke(self) -> str:
+        async with self.bot.session.get(
+            self.dadjoke_url, headers={"Accept": "application/json", "User-Agent": "modmail-fun-plugin"}
+        ) as resp:
+            resp.raise_for_status()
+            return (await resp.json())["joke"]
         
     @commands.command()
     async def choose(self, ctx, *choices):
@@ -157,8 +337,7 @@ class Fun(Cog):
     @commands.command(aliases=["badjoke"])
     async def dadjoke(self,ctx):
         """Gives a random Dadjoke"""
-        x = Dadjoke()
-        await ctx.send(x.joke)
+        await ctx.send(self.dadjokes.take())
         
     @commands.command()
     async def lmgtfy(self, ctx, *, search_terms: str):
@@ -193,17 +372,22 @@ class Fun(Cog):
     @commands.command()
     async def meme(self, ctx):
         """Get a random meme. The stuff of life."""
-        r = await self.bot.session.get("https://www.reddit.com/r/dankmemes/top.json?sort=top&t=day&limit=500")
-        r = await r.json()
-        r = box.Box(r)
-        data = choice(r.data.children).data
-        img = data.url
-        title = data.title
-        upvotes = data.ups
-        downvotes = data.downs
+        if not self.memes.ready.is_set():
+            # Only right after loading, before the first fetch finished
+            try:
+                await asyncio.wait_for(self.memes.ready.wait(), timeout=10)
+            except asyncio.TimeoutError:
+                pass
+        post = self.memes.pick(ctx.channel.id)
+        if post is None:
+            return await ctx.send("Couldn't load any memes right now, try again later.")
+        img = post["url"]
+        title = post["title"]
+        upvotes = post["ups"]
+        downvotes = post["downs"]
         em = discord.Embed(color=ctx.author.color, title=title)
         em.set_image(url=img)
-        em.set_author(name=ctx.author.name, icon_url=ctx.author.avatar_url)
+        em.set_author(name=ctx.author.name, icon_url=ctx.author.display_avatar.url)
         em.set_footer(text=f"👍{upvotes} | 👎 {downvotes}")
         await ctx.send(embed=em)
     @commands.command()
@@ -282,4 +466,4 @@ class Fun(Cog):
 
       
 async def setup(bot):
-    bot.add_cog(Fun(bot))
+    await bot.add_cog(Fun(bot))
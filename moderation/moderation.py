@@ -1,18 +1,523 @@
+import asyncio
+import bisect
 import discord
+import io
+import re
+from collections import OrderedDict
+from typing import Optional
 from discord.ext import commands
+from pymongo import DeleteOne, InsertOne, ReturnDocument
+from pymongo.errors import BulkWriteError, ConnectionFailure
 from core import checks
-from core.models import PermissionLevel
+from core.models import PermissionLevel, getLogger
 import datetime
 from discord.utils import utcnow  # Ensure you import utcnow
 
+logger = getLogger(__name__)
+
+
+class IdCounter:
+    """
+    Hands out unique, increasing IDs from an atomic counter document.
+
+    IDs are reserved in blocks of ``block_size``, so most of them don't need a database
+    round trip. IDs left in a block when the bot stops are skipped, never reused.
+    """
+
+    def __init__(self, db, counter_id, block_size):
+        self.db = db
+        self.counter_id = counter_id
+        self.block_size = block_size
+        self.lock = asyncio.Lock()
+        self.next_id = 1
+        self.last_id = 0  # last ID of the reserved block
+
+    async def reserve(self, count: int = 1) -> list:
+        async with self.lock:
+            if self.last_id - self.next_id + 1 < count:
+                size = max(count, self.block_size)
+                counter = await self.db.find_one_and_update(
+                    {"_id": self.counter_id},
+                    {"$inc": {"value": size}},
+                    upsert=True,
+                    return_document=ReturnDocument.AFTER,
+                )
+                self.last_id = counter["value"]
+                self.next_id = self.last_id - size + 1
+            ids = list(range(self.next_id, self.next_id + count))
+            self.next_id += count
+            return ids
+
+
+class WriteBehind:
+    """
+    Queues write operations and sends them in one ordered ``bulk_write``.
+
+    The write happens ``flush_delay`` seconds after the first queued operation, so
+    commands never wait for it. A batch that fails on the network is sent again, but
+    operations the server already applied are not: a retried insert that hits its own
+    earlier write is recognized by the duplicate key error and skipped.
+    """
+
+    duplicate_key = 11000
+
+    def __init__(self, db, flush_delay):
+        self.db = db
+        self.flush_delay = flush_delay
+        self.pending = []  # write operations not sent yet
+        self.flush_task = None
+        self.flush_lock = asyncio.Lock()
+
+    def queue(self, operation):
+        self.pending.append(operation)
+        self.schedule()
+
+    def schedule(self):
+        if self.flush_task is None:
+            self.flush_task = asyncio.create_task(self.flush_later())
+
+    async def flush_later(self):
+        await asyncio.sleep(self.flush_delay)
+        self.flush_task = None
+        await self.flush()
+
+    async def flush(self):
+        async with self.flush_lock:
+            if not self.pending:
+                return
+            operations, self.pending = self.pending, []
+            while operations:
+                try:
+                    # Ordered, so a delete never runs before the insert it undoes
+                    await self.db.bulk_write(operations, ordered=True)
+                except BulkWriteError as e:
+                    # Everything before the failing operation was applied, everything after it wasn't sent
+                    error = e.details["writeErrors"][0]
+                    if error["code"] != self.duplicate_key:
+                        logger.error("Dropped a change that failed to write: %s", error.get("errmsg"))
+                    operations = operations[error["index"] + 1 :]
+                except ConnectionFailure as e:
+                    logger.warning("Failed to write %d change(s), retrying: %s", len(operations), e)
+                    self.pending[:0] = operations
+                    self.schedule()
+                    return
+                except Exception:
+                    logger.exception("Dropped %d change(s) that failed to write.", len(operations))
+                    return
+                else:
+                    return
+
+    async def close(self):
+        if self.flush_task is not None:
+            self.flush_task.cancel()
+            self.flush_task = None
+        await self.flush()
+        # Nothing retries after unloading
+        if self.flush_task is not None:
+            self.flush_task.cancel()
+            self.flush_task = None
+
+
+class WarningStore:
+    """
+    Warnings stored in ``plugin_db``, with the warnings of recently active members cached.
+
+    Warning IDs come from an atomic counter, so they stay unique across restarts, and
+    inserts and deletes are written behind.
+    """
+
+    def __init__(self, db, writer, cache_size, id_block_size):
+        self.db = db
+        self.writer = writer
+        self.cache_size = cache_size
+        self.ids = IdCounter(db, "warning_counter", id_block_size)
+        self.cache = OrderedDict()  # (guild_id, member_id) -> warning documents, least recently used first
+
+    async def get(self, guild_id: int, member_id: int) -> list:
+        """Returns the warnings of a member, oldest first."""
+        key = (guild_id, member_id)
+        if key in self.cache:
+            self.cache.move_to_end(key)
+            return self.cache[key]
+        # Writes still queued for this member have to land before reading them back
+        await self.writer.flush()
+        cursor = self.db.find({"type": "warning", "member_id": member_id, "guild_id": guild_id})
+        warnings = await cursor.sort("created_at", 1).to_list(length=None)
+        self.cache_put(key, warnings)
+        return warnings
+
+    def cache_put(self, key, warnings):
+        self.cache[key] = warnings
+        self.cache.move_to_end(key)
+        while len(self.cache) > self.cache_size:
+            self.cache.popitem(last=False)
+
+    async def add(self, guild_id: int, member_id: int, moderator_id: int, reason: str) -> dict:
+        warning_id, = await self.ids.reserve()
+        warning = {
+            "_id": warning_id,
+            "type": "warning",
+            "guild_id": guild_id,
+            "member_id": member_id,
+            "moderator_id": moderator_id,
+            "reason": reason,
+            "created_at": utcnow(),
+        }
+        key = (guild_id, member_id)
+        if key in self.cache:
+            self.cache[key].append(warning)
+            self.cache.move_to_end(key)
+        self.writer.queue(InsertOne(warning))
+        return warning
+
+    async def remove(self, guild_id: int, member_id: int, warning_id: int) -> Optional[dict]:
+        """Removes a warning, returning it or None if the member has no warning with that ID."""
+        warnings = await self.get(guild_id, member_id)
+        for idx, warning in enumerate(warnings):
+            if warning["_id"] == warning_id:
+                del warnings[idx]
+                self.writer.queue(DeleteOne({"_id": warning_id}))
+                return warning
+        return None
+
+
+class LogSink:
+    """
+    Buffers moderation log lines and sends them to the log channel as combined embeds.
+
+    A batch is sent once it holds ``batch_size`` lines or ``flush_interval`` seconds
+    after its first line, whichever comes first, so a mass action costs a few messages
+    instead of one per target. Lines are queued without waiting for the send.
+    """
+
+    def __init__(self, get_channel, color, batch_size, flush_interval, queue_size):
+        self.get_channel = get_channel
+        self.color = color
+        self.batch_size = batch_size
+        self.flush_interval = flush_interval
+        self.queue = asyncio.Queue(maxsize=queue_size)
+        self.batch = []  # lines taken from the queue but not sent yet
+        self.task = None
+        self.dropped = 0
+        self.messages_sent = 0
+
+    def start(self):
+        if self.task is None:
+            self.task = asyncio.create_task(self.run())
+
+    def put(self, line: str):
+        try:
+            self.queue.put_nowait(line)
+        except asyncio.QueueFull:
+            self.dropped += 1
+
+    async def run(self):
+        loop = asyncio.get_running_loop()
+        while True:
+            self.batch.append(await self.queue.get())
+            deadline = loop.time() + self.flush_interval
+            while len(self.batch) < self.batch_size:
+                timeout = deadline - loop.time()
+                if timeout <= 0:
+                    break
+                try:
+                    self.batch.append(await asyncio.wait_for(self.queue.get(), timeout))
+                except asyncio.TimeoutError:
+                    break
+            batch, self.batch = self.batch, []
+            try:
+                await self.send(batch)
+            except Exception:
+                logger.exception("Failed to send %d moderation log line(s).", len(batch))
+
+    def embeds(self, lines: list) -> list:
+        embeds = []
+        description = ""
+        for line in lines:
+            line = f"📝 | {line}"[:4000]
+            if description and len(description) + len(line) + 1 > 4000:
+                embeds.append(description)
+                description = ""
+            description = f"{description}\n{line}" if description else line
+        if description:
+            embeds.append(description)
+        result = []
+        for description in embeds:
+            embed = discord.Embed(title="Moderation Log", description=description, color=self.color, timestamp=utcnow())
+            embed.set_footer(text="AirAsia Group RBLX")
+            result.append(embed)
+        return result
+
+    async def send(self, lines: list):
+        channel = self.get_channel()
+        if channel is None or not lines:
+            return
+        # A message can't carry more than 6000 characters of embeds, so each gets its own
+        for embed in self.embeds(lines):
+            try:
+                await channel.send(embed=embed)
+            except discord.HTTPException as e:
+                logger.warning("Failed to send %d moderation log line(s): %s", len(lines), e)
+                return
+            self.messages_sent += 1
+
+    async def close(self):
+        if self.task is not None:
+            self.task.cancel()
+            self.task = None
+        lines, self.batch = self.batch, []
+        while not self.queue.empty():
+            lines.append(self.queue.get_nowait())
+        for i in range(0, len(lines), self.batch_size):
+            await self.send(lines[i : i + self.batch_size])
+
+
+def warning_timestamp(warning: dict) -> float:
+    created_at = warning["created_at"]
+    # Mongo hands datetimes back naive, in UTC
+    if created_at.tzinfo is None:
+        created_at = created_at.replace(tzinfo=datetime.timezone.utc)
+    return created_at.timestamp()
+
+
+def parse_window(value: str) -> Optional[int]:
+    """Parses durations like ``30m``, ``24h`` or ``7d`` into seconds."""
+    match = re.fullmatch(r"(\d+)\s*([smhdw])", value.strip().lower())
+    if match is None:
+        return None
+    return int(match.group(1)) * {"s": 1, "m": 60, "h": 3600, "d": 86400, "w": 604800}[match.group(2)]
+
+
+def format_window(seconds: int) -> str:
+    for unit, size in (("w", 604800), ("d", 86400), ("h", 3600), ("m", 60)):
+        if seconds % size == 0:
+            return f"{seconds // size}{unit}"
+    return f"{seconds}s"
+
+
+class WarningWindows:
+    """
+    Sorted warning timestamps per member, for counting warnings in sliding windows.
+
+    A count is a bisect on the member's timestamps. Timestamps older than the longest
+    window are pruned lazily when the member is touched, and members with nothing left
+    in that window are dropped from the least recently warned end, so memory stays
+    bounded by the members warned recently.
+    """
+
+    def __init__(self, max_members):
+        self.max_members = max_members
+        self.members = OrderedDict()  # (guild_id, member_id) -> sorted timestamps, least recently warned first
+
+    def __contains__(self, key):
+        return key in self.members
+
+    def seed(self, key, timestamps):
+        self.members[key] = sorted(timestamps)
+
+    def add(self, key, timestamp: float, horizon: float):
+        timestamps = self.members.setdefault(key, [])
+        bisect.insort(timestamps, timestamp)
+        self.members.move_to_end(key)
+        del timestamps[: bisect.bisect_left(timestamps, timestamp - horizon)]
+        # Members only leave from the front once all their warnings fell out of every window
+        while self.members:
+            oldest_key, oldest = next(iter(self.members.items()))
+            if len(self.members) <= self.max_members and oldest and oldest[-1] >= timestamp - horizon:
+                break
+            del self.members[oldest_key]
+
+    def remove(self, key, timestamp: float):
+        timestamps = self.members.get(key)
+        if not timestamps:
+            return
+        idx = bisect.bisect_left(timestamps, timestamp)
+        if idx < len(timestamps) and timestamps[idx] == timestamp:
+            del timestamps[idx]
+
+    def count(self, key, since: float) -> int:
+        timestamps = self.members.get(key, [])
+        return len(timestamps) - bisect.bisect_left(timestamps, since)
+
+
+class PurgeFlags(commands.FlagConverter):
+    user: Optional[discord.User] = None
+    regex: Optional[str] = None
+    attachments: bool = False
+    bots: bool = False
+    before: Optional[int] = None
+    after: Optional[int] = None
+
+
+class MassActionFlags(commands.FlagConverter):
+    joined: Optional[int] = None
+    duration: int = 60
+    reason: Optional[str] = None
+
+
+class CaseFlags(commands.FlagConverter):
+    target: Optional[discord.User] = None
+    moderator: Optional[discord.User] = None
+    action: Optional[str] = None
+    within: Optional[str] = None
+
+
+class CasePages(discord.ui.View):
+    """
+    Pages through the cases matching a query, newest first.
+
+    Pages are fetched on demand with ``case_id`` as the cursor; only the current page
+    and the case IDs the visited pages start below are kept.
+    """
+
+    def __init__(self, cog, author_id: int, query: dict, page_size: int):
+        super().__init__(timeout=300)
+        self.cog = cog
+        self.author_id = author_id
+        self.query = query
+        self.page_size = page_size
+        self.cursors = [None]  # exclusive upper case_id bound of each visited page
+        self.cases = []
+        self.has_next = False
+
+    async def fetch(self):
+        query = dict(self.query)
+        if self.cursors[-1] is not None:
+            query["case_id"] = {"$lt": self.cursors[-1]}
+        cursor = self.cog.db.find(query).sort("case_id", -1).limit(self.page_size + 1)
+        cases = await cursor.to_list(length=self.page_size + 1)
+        self.cases = cases[: self.page_size]
+        self.has_next = len(cases) > self.page_size
+        self.previous_page.disabled = len(self.cursors) == 1
+        self.next_page.disabled = not self.has_next
+
+    def embed(self) -> discord.Embed:
+        lines = []
+        for case in self.cases:
+            created_at = case["created_at"]
+            if created_at.tzinfo is None:
+                created_at = created_at.replace(tzinfo=datetime.timezone.utc)
+            target = f"<@{case['target_id']}>" if case.get("target_id") else f"<#{case.get('channel_id')}>"
+            line = f"**#{case['case_id']}** {case['action']} {target} by <@{case['moderator_id']}> {discord.utils.format_dt(created_at, 'R')}"
+            if case.get("reason"):
+                line += f"\n{case['reason'][:200]}"
+            lines.append(line)
+        embed = discord.Embed(
+            title="Moderation Cases",
+            description="\n".join(lines) or "No cases found.",
+            color=self.cog.bot.main_color,
+        )
+        embed.set_footer(text=f"Page {len(self.cursors)}")
+        return embed
+
+    async def interaction_check(self, interaction: discord.Interaction) -> bool:
+        return interaction.user.id == self.author_id
+
+    @discord.ui.button(label="Previous", style=discord.ButtonStyle.secondary)
+    async def previous_page(self, interaction: discord.Interaction, button: discord.ui.Button):
+        if len(self.cursors) > 1:
+            self.cursors.pop()
+        await self.fetch()
+        await interaction.response.edit_message(embed=self.embed(), view=self)
+
+    @discord.ui.button(label="Next", style=discord.ButtonStyle.secondary)
+    async def next_page(self, interaction: discord.Interaction, button: discord.ui.Button):
+        if self.has_next and self.cases:
+            self.cursors.append(self.cases[-1]["case_id"])
+        await self.fetch()
+        await interaction.response.edit_message(embed=self.embed(), view=self)
+
+
 class Moderation(commands.Cog):
+    # (keys, options) of the indexes created at load
+    db_indexes = [
+        ([("member_id", 1), ("created_at", 1)], {"name": "member_created_at"}),
+        # Cases are paged by case_id, newest first, within each filter
+        ([("guild_id", 1), ("case_id", -1)], {"name": "guild_case"}),
+        ([("target_id", 1), ("case_id", -1)], {"name": "target_case"}),
+        ([("moderator_id", 1), ("case_id", -1)], {"name": "moderator_case"}),
+        ([("action", 1), ("case_id", -1)], {"name": "action_case"}),
+        ([("created_at", 1)], {"name": "created_at"}),
+    ]
+    # Seconds to collect warning and case changes before writing them in one go
+    write_delay = 2
+    # Members whose warnings are kept in memory
+    warning_cache_size = 1000
+    # Warning IDs reserved from the counter at once
+    warning_id_block_size = 10
+    # Case IDs reserved from the counter at once
+    case_id_block_size = 10
+    # Cases shown per page of the cases command
+    cases_page_size = 10
+    # Log lines combined into one embed at most
+    log_batch_size = 15
+    # Seconds to wait for more log lines before sending a batch
+    log_flush_interval = 3
+    # Log lines waiting to be sent before new ones are dropped
+    log_queue_size = 5000
+    valid_actions = {'ban', 'unban', 'kick', 'timeout', 'untimeout', 'warn', 'unwarn', 'purge'}
+    # Most messages a single purge deletes
+    purge_max = 10000
+    # Most messages a single purge looks at while matching its filters
+    purge_scan_limit = 50000
+    # Messages older than 14 days waiting for a single delete before the scan pauses
+    purge_queue_size = 100
+    # Seconds between single deletes of messages too old for bulk deletes
+    purge_delete_delay = 1.2
+    # Seconds between progress updates
+    purge_progress_interval = 5
+    # Most targets of a single mass action
+    mass_action_max = 1000
+    # Targets acted on at the same time by mass actions without a bulk endpoint
+    mass_action_concurrency = 5
+    # Seconds each of those slots waits after an action, to stay clear of rate limits
+    mass_action_delay = 0.5
+    # Users per bulk_ban request, the most Discord accepts
+    bulk_ban_size = 200
+    # Members whose recent warning times are kept for the escalation rules
+    escalation_max_members = 10000
+    escalation_actions = ("timeout", "kick", "ban")
+
     def __init__(self, bot: commands.Bot):
         self.bot: commands.Bot = bot
-        self.logging_channel = None
+        self.db = bot.plugin_db.get_partition(self)
+        self.logging_channel_id = None
         self.log_all = True  # Log all actions if True, or specific actions if False
         self.log_actions = set()  # Actions to log if log_all is False
-        self.member_actions = {}  # To track actions taken on each member
-        self.warning_id_counter = 0  # Counter for unique warning IDs
+        self.log_sink = LogSink(
+            self.get_logging_channel,
+            self.bot.main_color,
+            self.log_batch_size,
+            self.log_flush_interval,
+            self.log_queue_size,
+        )
+        self.escalation_rules = []  # {"count", "window" (seconds), "action", "duration" (minutes)}
+        self.warning_windows = WarningWindows(self.escalation_max_members)
+        self.writer = WriteBehind(self.db, self.write_delay)
+        self.warnings = WarningStore(self.db, self.writer, self.warning_cache_size, self.warning_id_block_size)
+        self.case_ids = IdCounter(self.db, "case_counter", self.case_id_block_size)
+
+    async def cog_load(self):
+        for keys, options in self.db_indexes:
+            await self.db.create_index(keys, **options)
+        config = await self.db.find_one({"_id": "config"}) or {}
+        self.logging_channel_id = config.get("logging_channel_id")
+        self.log_all = config.get("log_all", True)
+        self.log_actions = set(config.get("log_actions", []))
+        self.escalation_rules = config.get("escalation_rules", [])
+        self.log_sink.start()
+
+    async def cog_unload(self):
+        await self.writer.close()
+        await self.log_sink.close()
+
+    async def update_config(self, **fields):
+        await self.db.update_one({"_id": "config"}, {"$set": fields}, upsert=True)
+
+    def get_logging_channel(self):
+        if self.logging_channel_id is None:
+            return None
+        return self.bot.get_channel(self.logging_channel_id)
 
     @commands.group(invoke_without_command=True)
     @commands.guild_only()
@@ -29,7 +534,8 @@ class Moderation(commands.Cog):
         """
         Set the channel for logging moderation actions.
         """
-        self.logging_channel = channel
+        self.logging_channel_id = channel.id
+        await self.update_config(logging_channel_id=channel.id)
         await ctx.send(f"✅ | Logging channel set to {channel.mention}.")
 
     @modlog.command()
@@ -41,9 +547,11 @@ class Moderation(commands.Cog):
         if mode.lower() == 'all':
             self.log_all = True
             self.log_actions.clear()  # Clear specific actions if logging all
+            await self.update_config(log_all=True, log_actions=[])
             await ctx.send("✅ | Logging set to all actions.")
         elif mode.lower() == 'specific':
             self.log_all = False
+            await self.update_config(log_all=False)
             await ctx.send("✅ | Logging set to specific actions. Use `modlog addaction` to specify actions.")
         else:
             await ctx.send("❌ | Invalid mode. Use either 'all' or 'specific'.")
@@ -52,11 +560,12 @@ class Moderation(commands.Cog):
     @checks.has_permissions(PermissionLevel.MODERATOR)
     async def addaction(self, ctx: commands.Context, action: str):
         """
-        Add a specific action to log (ban, unban, kick, timeout, warn, unwarn, purge).
+        Add a specific action to log (ban, unban, kick, timeout, untimeout, warn, unwarn, purge).
         """
-        valid_actions = {'ban', 'unban', 'kick', 'timeout', 'warn', 'unwarn', 'purge'}
+        valid_actions = self.valid_actions
         if action.lower() in valid_actions:
             self.log_actions.add(action.lower())
+            await self.update_config(log_actions=sorted(self.log_actions))
             await ctx.send(f"✅ | Action `{action}` added to log.")
         else:
             await ctx.send(f"❌ | Invalid action. Valid actions are: {', '.join(valid_actions)}")
@@ -69,10 +578,124 @@ class Moderation(commands.Cog):
         """
         if action.lower() in self.log_actions:
             self.log_actions.remove(action.lower())
+            await self.update_config(log_actions=sorted(self.log_actions))
             await ctx.send(f"✅ | Action `{action}` removed from logging.")
         else:
             await ctx.send("❌ | That action isn't being logged.")
 
+    @commands.group(invoke_without_command=True)
+    @commands.guild_only()
+    @checks.has_permissions(PermissionLevel.MODERATOR)
+    async def escalation(self, ctx: commands.Context):
+        """
+        Manage the rules that escalate repeated warnings.
+
+        A rule applies when a member got at least `count` warnings within `window`,
+        for example 3 warnings in 24h to a 60 minute timeout or 5 in 7d to a kick.
+        When several rules apply, the most severe one is used.
+        """
+        await ctx.send_help(ctx.command)
+
+    @escalation.command(name="list")
+    @checks.has_permissions(PermissionLevel.MODERATOR)
+    async def escalation_list(self, ctx: commands.Context):
+        """
+        List the escalation rules.
+        """
+        if not self.escalation_rules:
+            await ctx.send("❌ | No escalation rules set.")
+            return
+        lines = []
+        for idx, rule in enumerate(self.escalation_rules, start=1):
+            action = rule["action"]
+            if action == "timeout":
+                action += f" for {rule['duration']} minutes"
+            lines.append(f"{idx}: {rule['count']} warnings in {format_window(rule['window'])} → {action}")
+        await ctx.send("\n".join(lines))
+
+    @escalation.command(name="add")
+    @checks.has_permissions(PermissionLevel.MODERATOR)
+    async def escalation_add(
+        self, ctx: commands.Context, count: int, window: str, action: str, duration: int = 60
+    ):
+        """
+        Add an escalation rule, the duration (minutes) only applies to timeouts.
+
+        Examples:
+        - `escalation add 3 24h timeout 60`
+        - `escalation add 5 7d kick`
+        """
+        action = action.lower()
+        seconds = parse_window(window)
+        if count < 1 or seconds is None:
+            await ctx.send("❌ | Use a count of at least 1 and a window like `30m`, `24h` or `7d`.")
+            return
+        if action not in self.escalation_actions:
+            await ctx.send(f"❌ | Invalid action. Valid actions are: {', '.join(self.escalation_actions)}")
+            return
+        if action == "timeout" and not 1 <= duration <= 40320:
+            await ctx.send("❌ | The duration has to be between 1 minute and 28 days (40320 minutes).")
+            return
+        rule = {"count": count, "window": seconds, "action": action, "duration": duration}
+        self.escalation_rules = self.escalation_rules + [rule]
+        await self.update_config(escalation_rules=self.escalation_rules)
+        await ctx.send(f"✅ | Escalation rule added: {count} warnings in {format_window(seconds)} → {action}.")
+
+    @escalation.command(name="remove")
+    @checks.has_permissions(PermissionLevel.MODERATOR)
+    async def escalation_remove(self, ctx: commands.Context, number: int):
+        """
+        Remove an escalation rule by its number in `escalation list`.
+        """
+        if not 1 <= number <= len(self.escalation_rules):
+            await ctx.send("❌ | That rule doesn't exist.")
+            return
+        self.escalation_rules = [rule for idx, rule in enumerate(self.escalation_rules, start=1) if idx != number]
+        await self.update_config(escalation_rules=self.escalation_rules)
+        await ctx.send(f"✅ | Escalation rule {number} removed.")
+
+    async def escalate(self, ctx: commands.Context, member: discord.Member, warning: dict):
+        """Records a new warning and applies the most severe escalation rule it triggers."""
+        if not self.escalation_rules:
+            return
+        key = (ctx.guild.id, member.id)
+        now = warning_timestamp(warning)
+        horizon = max(rule["window"] for rule in self.escalation_rules)
+        if key not in self.warning_windows:
+            # First warning since the restart, the earlier ones come from the warning store
+            warnings = await self.warnings.get(ctx.guild.id, member.id)
+            self.warning_windows.seed(key, [warning_timestamp(w) for w in warnings if w["_id"] != warning["_id"]])
+        self.warning_windows.add(key, now, horizon)
+
+        severity = {action: idx for idx, action in enumerate(self.escalation_actions)}
+        triggered = [
+            rule
+            for rule in self.escalation_rules
+            if self.warning_windows.count(key, now - rule["window"]) >= rule["count"]
+        ]
+        if not triggered:
+            return
+        rule = max(triggered, key=lambda r: (severity[r["action"]], r["duration"]))
+        reason = f"{rule['count']} warnings in {format_window(rule['window'])}"
+        try:
+            if rule["action"] == "timeout":
+                until = utcnow() + datetime.timedelta(minutes=rule["duration"])
+                await member.edit(timed_out_until=until, reason=reason)
+                result = f"timed out for {rule['duration']} minutes"
+            elif rule["action"] == "kick":
+                await member.kick(reason=reason)
+                result = "kicked"
+            else:
+                await member.ban(reason=reason)
+                result = "banned"
+        except discord.HTTPException as e:
+            await ctx.send(f"❌ | Could not escalate the warnings of {member.mention}: {e}")
+            return
+        await ctx.send(f"⚠️ | {member.mention} has been {result} for reaching {reason}.")
+        self.log_action(ctx.guild, rule["action"], f"{member} was {result} for reaching {reason}")
+        details = {"duration": rule["duration"]} if rule["action"] == "timeout" else {}
+        await self.record_cases(ctx.guild, rule["action"], [member.id], ctx.author.id, f"Escalation: {reason}", **details)
+
     def has_higher_role(self, ctx: commands.Context, member: discord.Member) -> bool:
         """
         Check if the command author has a higher role than the member.
@@ -101,7 +724,8 @@ class Moderation(commands.Cog):
         
         await member.ban(reason=reason)
         await ctx.send(f"🔨 | {member.mention} has been banned.")
-        await self.log_action(ctx.guild, f"{member} was banned for: {reason}")
+        self.log_action(ctx.guild, "ban", f"{member} was banned for: {reason}")
+        await self.record_cases(ctx.guild, "ban", [member.id], ctx.author.id, reason)
 
     @commands.command()
     @checks.has_permissions(PermissionLevel.MODERATOR)
@@ -111,7 +735,8 @@ class Moderation(commands.Cog):
         """
         await ctx.guild.unban(user)
         await ctx.send(f"✅ | {user.mention} has been unbanned.")
-        await self.log_action(ctx.guild, f"{user} was unbanned.")
+        self.log_action(ctx.guild, "unban", f"{user} was unbanned.")
+        await self.record_cases(ctx.guild, "unban", [user.id], ctx.author.id)
 
     @commands.command()
     @checks.has_permissions(PermissionLevel.MODERATOR)
@@ -127,7 +752,8 @@ class Moderation(commands.Cog):
         
         await member.kick(reason=reason)
         await ctx.send(f"👢 | {member.mention} has been kicked.")
-        await self.log_action(ctx.guild, f"{member} was kicked for: {reason}")
+        self.log_action(ctx.guild, "kick", f"{member} was kicked for: {reason}")
+        await self.record_cases(ctx.guild, "kick", [member.id], ctx.author.id, reason)
 
     @commands.command()
     @checks.has_permissions(PermissionLevel.MODERATOR)
@@ -145,7 +771,8 @@ class Moderation(commands.Cog):
         timeout_until = discord.utils.utcnow() + datetime.timedelta(minutes=duration)
         await member.edit(timed_out_until=timeout_until, reason=reason)
         await ctx.send(f"⏲️ | {member.mention} has been timed out for {duration} minutes.")
-        await self.log_action(ctx.guild, f"{member} was timed out for {duration} minutes for: {reason}")
+        self.log_action(ctx.guild, "timeout", f"{member} was timed out for {duration} minutes for: {reason}")
+        await self.record_cases(ctx.guild, "timeout", [member.id], ctx.author.id, reason, duration=duration)
 
     @commands.command()
     @checks.has_permissions(PermissionLevel.MODERATOR)
@@ -162,7 +789,8 @@ class Moderation(commands.Cog):
 
         await member.edit(timed_out_until=None, reason="Timeout removed")
         await ctx.send(f"✅ | Timeout removed from {member.mention}.")
-        await self.log_action(ctx.guild, f"Timeout removed from {member}.")
+        self.log_action(ctx.guild, "untimeout", f"Timeout removed from {member}.")
+        await self.record_cases(ctx.guild, "untimeout", [member.id], ctx.author.id)
 
     @commands.command()
     @checks.has_permissions(PermissionLevel.MODERATOR)
@@ -176,12 +804,8 @@ class Moderation(commands.Cog):
         if not self.has_higher_role(ctx, member):
             return await self.send_permission_error(ctx)
         
-        self.warning_id_counter += 1
-        warning_id = self.warning_id_counter
-
-        if member.id not in self.member_actions:
-            self.member_actions[member.id] = []
-        self.member_actions[member.id].append((warning_id, reason))
+        warning = await self.warnings.add(ctx.guild.id, member.id, ctx.author.id, reason)
+        warning_id = warning["_id"]
 
         embed = discord.Embed(
             title="You Have Been Warned",
@@ -195,7 +819,9 @@ class Moderation(commands.Cog):
             await ctx.send(f"⚠️ | Could not send a DM to {member.mention}.")
 
         await ctx.send(f"⚠️ | {member.mention} has been warned for: {reason}\nWarning ID: {warning_id}")
-        await self.log_action(ctx.guild, f"{member} was warned for: {reason} (ID: {warning_id})")
+        self.log_action(ctx.guild, "warn", f"{member} was warned for: {reason} (ID: {warning_id})")
+        await self.record_cases(ctx.guild, "warn", [member.id], ctx.author.id, reason, warning_id=warning_id)
+        await self.escalate(ctx, member, warning)
 
     @commands.command()
     @checks.has_permissions(PermissionLevel.MODERATOR)
@@ -210,46 +836,398 @@ class Moderation(commands.Cog):
         if not self.has_higher_role(ctx, member):
             return await self.send_permission_error(ctx)
         
-        if member.id in self.member_actions:
-            warnings = self.member_actions[member.id]
-            new_warnings = [w for w in warnings if w[0] != warning_id]
-            if len(new_warnings) == len(warnings):
+        if await self.warnings.get(ctx.guild.id, member.id):
+            removed = await self.warnings.remove(ctx.guild.id, member.id, warning_id)
+            if removed is None:
                 await ctx.send(f"❌ | No warning with ID {warning_id} found for {member.mention}.")
             else:
-                self.member_actions[member.id] = new_warnings
+                self.warning_windows.remove((ctx.guild.id, member.id), warning_timestamp(removed))
                 await ctx.send(f"⚠️ | Warning ID {warning_id} has been removed from {member.mention}.")
-                await self.log_action(ctx.guild, f"Warning ID {warning_id} was removed from {member}.")
+                self.log_action(ctx.guild, "unwarn", f"Warning ID {warning_id} was removed from {member}.")
+                await self.record_cases(ctx.guild, "unwarn", [member.id], ctx.author.id, warning_id=warning_id)
         else:
             await ctx.send(f"❌ | {member.mention} does not have any warnings.")
 
     @commands.command()
     @checks.has_permissions(PermissionLevel.MODERATOR)
-    async def purge(self, ctx: commands.Context, amount: int):
+    async def purge(self, ctx: commands.Context, amount: int, *, flags: PurgeFlags):
         """
         Purge a large number of messages from the channel.
+
+        Only messages matching all given filters are deleted:
+        `user:` author, `regex:` pattern the content has to contain, `attachments: yes`,
+        `bots: yes`, `before:`/`after:` message IDs.
+
+        Examples:
+        - `purge 500`
+        - `purge 200 user: @someone`
+        - `purge 1000 bots: yes after: 1234567890`
+        - `purge 50 regex: discord.gg/`
         """
-        if amount <= 0 or amount > 100:
-            await ctx.send("❌ | Please specify a number between 1 and 100.")
+        if amount <= 0 or amount > self.purge_max:
+            await ctx.send(f"❌ | Please specify a number between 1 and {self.purge_max}.")
             return
         
         # Ensure the user has permission to purge messages
         if not ctx.channel.permissions_for(ctx.author).manage_messages:
             await ctx.send("❌ | You do not have permission to manage messages in this channel.")
             return
-        
-        await ctx.channel.purge(limit=amount)
-        await ctx.send(f"🧹 | Purged {amount} messages.", delete_after=5)
-        await self.log_action(ctx.guild, f"Purged {amount} messages in {ctx.channel}.")
 
-    async def log_action(self, guild: discord.Guild, message: str):
+        pattern = None
+        if flags.regex is not None:
+            try:
+                pattern = re.compile(flags.regex)
+            except re.error as e:
+                await ctx.send(f"❌ | Invalid regex: {e}")
+                return
+
+        def matches(message: discord.Message) -> bool:
+            if message.pinned:
+                return False
+            if flags.user is not None and message.author.id != flags.user.id:
+                return False
+            if flags.bots and not message.author.bot:
+                return False
+            if flags.attachments and not message.attachments:
+                return False
+            if pattern is not None and pattern.search(message.content) is None:
+                return False
+            return True
+
+        status = await ctx.send("🧹 | Purging messages...")
+        stats = await self.stream_purge(
+            ctx.channel,
+            amount,
+            matches,
+            before=discord.Object(id=flags.before) if flags.before else ctx.message,
+            after=discord.Object(id=flags.after) if flags.after else None,
+            status=status,
+        )
+        summary = f"🧹 | Purged {stats['deleted']} messages (looked at {stats['scanned']})."
+        if stats["failed"]:
+            summary += f" {stats['failed']} could not be deleted."
+        try:
+            await status.edit(content=summary, delete_after=5)
+        except discord.HTTPException:
+            await ctx.send(summary, delete_after=5)
+        self.log_action(ctx.guild, "purge", f"Purged {stats['deleted']} messages in {ctx.channel}.")
+        await self.record_cases(
+            ctx.guild, "purge", [None], ctx.author.id, channel_id=ctx.channel.id, deleted=stats["deleted"]
+        )
+
+    async def stream_purge(self, channel, amount: int, matches, *, before, after, status) -> dict:
+        """
+        Deletes up to ``amount`` messages of ``channel`` for which ``matches`` returns True.
+
+        The history is walked lazily. Messages younger than 14 days are deleted in bulk
+        chunks of 100, older ones go through a bounded queue of paced single deletes,
+        so memory stays bounded no matter how many messages are purged.
+        """
+        stats = {"scanned": 0, "matched": 0, "deleted": 0, "failed": 0}
+        # A little margin, the age is checked by Discord when the request arrives
+        bulk_cutoff = utcnow() - datetime.timedelta(days=14) + datetime.timedelta(minutes=5)
+        old_messages = asyncio.Queue(maxsize=self.purge_queue_size)
+        single_deleter = asyncio.create_task(self.delete_paced(old_messages, stats))
+        loop = asyncio.get_running_loop()
+        next_progress = loop.time() + self.purge_progress_interval
+        chunk = []
+
+        async def delete_chunk():
+            try:
+                if len(chunk) == 1:
+                    await chunk[0].delete()
+                else:
+                    await channel.delete_messages(chunk)
+            except discord.NotFound:
+                pass
+            except discord.HTTPException as e:
+                logger.warning("Failed to bulk delete %d messages: %s", len(chunk), e)
+                stats["failed"] += len(chunk)
+            else:
+                stats["deleted"] += len(chunk)
+            chunk.clear()
+
+        try:
+            async for message in channel.history(limit=self.purge_scan_limit, before=before, after=after):
+                stats["scanned"] += 1
+                if matches(message):
+                    stats["matched"] += 1
+                    if message.created_at > bulk_cutoff:
+                        chunk.append(message)
+                        if len(chunk) == 100:
+                            await delete_chunk()
+                    else:
+                        await old_messages.put(message)
+                    if stats["matched"] >= amount:
+                        break
+                if loop.time() >= next_progress:
+                    next_progress = loop.time() + self.purge_progress_interval
+                    await self.purge_progress(status, stats)
+            if chunk:
+                await delete_chunk()
+            while not old_messages.empty():
+                await asyncio.sleep(self.purge_progress_interval)
+                await self.purge_progress(status, stats)
+            await old_messages.join()
+        finally:
+            single_deleter.cancel()
+        return stats
+
+    async def delete_paced(self, queue: asyncio.Queue, stats: dict):
+        while True:
+            message = await queue.get()
+            try:
+                await message.delete()
+            except discord.NotFound:
+                pass
+            except discord.HTTPException:
+                stats["failed"] += 1
+            else:
+                stats["deleted"] += 1
+            finally:
+                queue.task_done()
+            await asyncio.sleep(self.purge_delete_delay)
+
+    async def purge_progress(self, status: discord.Message, stats: dict):
+        try:
+            await status.edit(
+                content=f"🧹 | Purging messages... {stats['deleted']} deleted, {stats['scanned']} looked at."
+            )
+        except discord.HTTPException:
+            pass
+
+    @commands.command()
+    @commands.guild_only()
+    @checks.has_permissions(PermissionLevel.MODERATOR)
+    async def massban(self, ctx: commands.Context, ids: commands.Greedy[int], *, flags: MassActionFlags):
+        """
+        Ban many users at once, by ID or the members who joined in the last minutes.
+
+        Examples:
+        - `massban 1234567890 2345678901 reason: raid`
+        - `massban joined: 10 reason: raid`
+        """
+        await self.run_mass_action(ctx, "ban", ids, flags)
+
+    @commands.command()
+    @commands.guild_only()
+    @checks.has_permissions(PermissionLevel.MODERATOR)
+    async def masskick(self, ctx: commands.Context, ids: commands.Greedy[int], *, flags: MassActionFlags):
+        """
+        Kick many members at once, by ID or the members who joined in the last minutes.
+
+        Examples:
+        - `masskick 1234567890 2345678901 reason: raid`
+        - `masskick joined: 10`
+        """
+        await self.run_mass_action(ctx, "kick", ids, flags)
+
+    @commands.command()
+    @commands.guild_only()
+    @checks.has_permissions(PermissionLevel.MODERATOR)
+    async def masstimeout(self, ctx: commands.Context, ids: commands.Greedy[int], *, flags: MassActionFlags):
+        """
+        Timeout many members at once for `duration:` minutes (default 60).
+
+        Examples:
+        - `masstimeout 1234567890 2345678901 duration: 30`
+        - `masstimeout joined: 10 duration: 1440 reason: raid`
+        """
+        await self.run_mass_action(ctx, "timeout", ids, flags)
+
+    async def mass_targets(self, ctx: commands.Context, ids: list, joined: Optional[int], members_only: bool):
+        """
+        Resolves the targets of a mass action, returning ``(targets, results)``.
+
+        Targets the author may not act on are left out up front and get their reason in ``results``.
+        """
+        targets = {}
+        results = {}
+        for target_id in ids:
+            member = ctx.guild.get_member(target_id)
+            if member is not None:
+                targets[target_id] = member
+            elif members_only:
+                results[target_id] = "skipped: not a member"
+            else:
+                targets[target_id] = discord.Object(id=target_id)
+        if joined is not None:
+            since = utcnow() - datetime.timedelta(minutes=joined)
+            for member in ctx.guild.members:
+                if member.joined_at is not None and member.joined_at >= since:
+                    targets.setdefault(member.id, member)
+        for target_id, target in list(targets.items()):
+            reason = None
+            if target_id == ctx.author.id:
+                reason = "that's you"
+            elif target_id == self.bot.user.id:
+                reason = "that's the bot"
+            elif isinstance(target, discord.Member) and not self.has_higher_role(ctx, target):
+                reason = "role is not lower than yours"
+            if reason is not None:
+                del targets[target_id]
+                results[target_id] = f"skipped: {reason}"
+        targets = list(targets.values())
+        for target in targets[self.mass_action_max :]:
+            results[target.id] = f"skipped: more than {self.mass_action_max} targets"
+        return targets[: self.mass_action_max], results
+
+    async def run_mass_action(self, ctx: commands.Context, action: str, ids: list, flags: MassActionFlags):
+        past = {"ban": "banned", "kick": "kicked", "timeout": "timed out"}[action]
+        if not ids and flags.joined is None:
+            return await ctx.send_help(ctx.command)
+        if action == "timeout" and not 1 <= flags.duration <= 40320:
+            await ctx.send("❌ | The duration has to be between 1 minute and 28 days (40320 minutes).")
+            return
+        targets, results = await self.mass_targets(ctx, ids, flags.joined, members_only=action != "ban")
+        status = await ctx.send(f"⏳ | {len(targets)} target(s) to be {past}...")
+        reason = flags.reason
+
+        if action == "ban" and hasattr(ctx.guild, "bulk_ban"):
+            await self.bulk_ban(ctx.guild, targets, reason, results, status)
+        else:
+            until = utcnow() + datetime.timedelta(minutes=flags.duration)
+            apply = {
+                "ban": lambda target: ctx.guild.ban(target, reason=reason),
+                "kick": lambda target: target.kick(reason=reason),
+                "timeout": lambda target: target.edit(timed_out_until=until, reason=reason),
+            }[action]
+            await self.run_paced(targets, apply, results, status)
+
+        done = [target_id for target_id, result in results.items() if result == "done"]
+        lines = []
+        for target_id, result in results.items():
+            member = ctx.guild.get_member(target_id)
+            lines.append(f"{target_id} ({member}): {result}" if member is not None else f"{target_id}: {result}")
+        summary = f"✅ | {len(done)} of {len(results)} target(s) {past}."
+        try:
+            await status.edit(content=summary)
+        except discord.HTTPException:
+            await ctx.send(summary)
+        report = "\n".join(lines)
+        if len(report) <= 1900:
+            await ctx.send(f"```\n{report}\n```")
+        else:
+            await ctx.send(file=discord.File(io.BytesIO(report.encode()), filename=f"mass{action}.txt"))
+        if done:
+            self.log_action(ctx.guild, action, f"{len(done)} members were mass {past} by {ctx.author} for: {reason}")
+            details = {"duration": flags.duration} if action == "timeout" else {}
+            await self.record_cases(ctx.guild, action, done, ctx.author.id, reason, mass=True, **details)
+
+    async def bulk_ban(self, guild: discord.Guild, targets: list, reason: str, results: dict, status: discord.Message):
+        for i in range(0, len(targets), self.bulk_ban_size):
+            chunk = targets[i : i + self.bulk_ban_size]
+            try:
+                result = await guild.bulk_ban(chunk, reason=reason)
+            except discord.HTTPException as e:
+                for target in chunk:
+                    results[target.id] = f"failed: {e}"
+            else:
+                for user in result.banned:
+                    results[user.id] = "done"
+                for user in result.failed:
+                    results[user.id] = "failed"
+            await self.mass_progress(status, results, len(targets))
+
+    async def run_paced(self, targets: list, apply, results: dict, status: discord.Message):
+        """Runs ``apply`` on every target, at most ``mass_action_concurrency`` at a time."""
+        semaphore = asyncio.Semaphore(self.mass_action_concurrency)
+
+        async def run(target):
+            async with semaphore:
+                try:
+                    await apply(target)
+                except discord.HTTPException as e:
+                    results[target.id] = f"failed: {e}"
+                else:
+                    results[target.id] = "done"
+                await asyncio.sleep(self.mass_action_delay)
+
+        tasks = [asyncio.create_task(run(target)) for target in targets]
+        try:
+            while tasks:
+                _, pending = await asyncio.wait(tasks, timeout=self.purge_progress_interval)
+                tasks = list(pending)
+                if tasks:
+                    await self.mass_progress(status, results, len(targets))
+        finally:
+            for task in tasks:
+                task.cancel()
+
+    async def mass_progress(self, status: discord.Message, results: dict, total: int):
+        finished = sum(1 for result in results.values() if not result.startswith("skipped"))
+        try:
+            await status.edit(content=f"⏳ | {finished}/{total} done...")
+        except discord.HTTPException:
+            pass
+
+    async def record_cases(
+        self, guild: discord.Guild, action: str, target_ids: list, moderator_id: int, reason: str = None, **details
+    ):
+        """Records a case per target, written behind like the warnings."""
+        created_at = utcnow()
+        case_ids = await self.case_ids.reserve(len(target_ids))
+        for case_id, target_id in zip(case_ids, target_ids):
+            case = {
+                "type": "case",
+                "case_id": case_id,
+                "guild_id": guild.id,
+                "action": action,
+                "target_id": target_id,
+                "moderator_id": moderator_id,
+                "reason": reason,
+                "created_at": created_at,
+            }
+            case.update(details)
+            self.writer.queue(InsertOne(case))
+
+    @commands.command()
+    @commands.guild_only()
+    @checks.has_permissions(PermissionLevel.MODERATOR)
+    async def cases(self, ctx: commands.Context, *, flags: CaseFlags):
+        """
+        Search the moderation cases, newest first.
+
+        Filters: `target:`, `moderator:`, `action:` and `within:` (like `24h` or `7d`).
+
+        Examples:
+        - `cases target: @someone`
+        - `cases moderator: @someone within: 7d`
+        - `cases action: ban`
+        """
+        query = {"type": "case", "guild_id": ctx.guild.id}
+        if flags.target is not None:
+            query["target_id"] = flags.target.id
+        if flags.moderator is not None:
+            query["moderator_id"] = flags.moderator.id
+        if flags.action is not None:
+            if flags.action.lower() not in self.valid_actions:
+                await ctx.send(f"❌ | Invalid action. Valid actions are: {', '.join(sorted(self.valid_actions))}")
+                return
+            query["action"] = flags.action.lower()
+        if flags.within is not None:
+            seconds = parse_window(flags.within)
+            if seconds is None:
+                await ctx.send("❌ | Use a window like `30m`, `24h` or `7d`.")
+                return
+            query["created_at"] = {"$gte": utcnow() - datetime.timedelta(seconds=seconds)}
+        # Cases recorded in the last few seconds may still be queued
+        await self.writer.flush()
+        view = CasePages(self, ctx.author.id, query, self.cases_page_size)
+        await view.fetch()
+        await ctx.send(embed=view.embed(), view=view)
+
+    def log_action(self, guild: discord.Guild, action: str, message: str):
         """
         Log an action if logging is enabled and the appropriate settings are in place.
+
+        The message is queued for the log sink, so this never waits for Discord.
         """
-        if not self.logging_channel:
+        if self.logging_channel_id is None:
             return
 
-        if self.log_all or message.split()[0].lower() in self.log_actions:
-            await self.logging_channel.send(f"📝 | {message}")
+        if self.log_all or action in self.log_actions:
+            self.log_sink.put(message)
 
 async def setup(bot: commands.Bot):
     await bot.add_cog(Moderation(bot))
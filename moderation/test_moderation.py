@@ -0,0 +1,75 @@
+"""
+Tests for the write-behind batching of warnings and cases.
+
+Run them from the Modmail root directory so ``core`` is importable:
+
+    python -m pytest plugins/<owner>/<repo>/moderation-<branch>/test_moderation.py
+"""
+
+import asyncio
+import importlib.util
+import sys
+from pathlib import Path
+
+from pymongo.errors import AutoReconnect, BulkWriteError
+
+sys.path.insert(0, ".")
+spec = importlib.util.spec_from_file_location("moderation", Path(__file__).with_name("moderation.py"))
+moderation = importlib.util.module_from_spec(spec)
+spec.loader.exec_module(moderation)
+
+
+class FlakyCollection:
+    """Applies ordered bulk writes like Mongo, optionally dropping the connection partway through one."""
+
+    def __init__(self, fail_after=None):
+        self.docs = {}
+        self.fail_after = fail_after  # operations applied before the connection drops, once
+        self.calls = 0
+
+    async def bulk_write(self, operations, ordered=True):
+        self.calls += 1
+        for idx, operation in enumerate(operations):
+            if self.fail_after is not None and idx == self.fail_after:
+                self.fail_after = None
+                raise AutoReconnect("connection reset")
+            if isinstance(operation, moderation.InsertOne):
+                doc = operation._doc
+                if doc["_id"] in self.docs:
+                    raise BulkWriteError(
+                        {"writeErrors": [{"index": idx, "code": 11000, "errmsg": "duplicate key"}], "nInserted": idx}
+                    )
+                self.docs[doc["_id"]] = doc
+            else:
+                self.docs.pop(operation._filter["_id"], None)
+
+
+def test_partial_failure_is_not_written_twice():
+    async def run():
+        db = FlakyCollection(fail_after=1)
+        writer = moderation.WriteBehind(db, 0.01)
+        for warning_id in range(1, 5):
+            writer.queue(moderation.InsertOne({"_id": warning_id}))
+        writer.queue(moderation.DeleteOne({"_id": 3}))
+        await asyncio.sleep(0.1)
+        await writer.close()
+        return db, writer
+
+    db, writer = asyncio.run(run())
+    assert sorted(db.docs) == [1, 2, 4]
+    assert writer.pending == []
+    # The first attempt, the retry that hit the duplicate and the rest of the batch
+    assert db.calls == 3
+
+
+def test_network_failure_is_retried_without_new_writes():
+    async def run():
+        db = FlakyCollection(fail_after=0)
+        writer = moderation.WriteBehind(db, 0.01)
+        writer.queue(moderation.InsertOne({"_id": 1}))
+        await asyncio.sleep(0.1)
+        return db, writer
+
+    db, writer = asyncio.run(run())
+    assert sorted(db.docs) == [1]
+    assert writer.pending == []
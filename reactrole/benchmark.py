@@ -0,0 +1,251 @@
+"""
+Load benchmark for the reaction role handlers.
+
+Drives ``add_reactrole_handler`` and ``remove_reactrole_handler`` with synthetic
+raw reaction payloads against stub guilds and members and an in-memory stand-in
+for ``plugin_db``, so neither Discord nor Mongo is needed.
+
+Run it from the Modmail root directory so ``core`` is importable:
+
+    python plugins/<owner>/<repo>/reactrole-<branch>/benchmark.py --events 20000
+"""
+
+import argparse
+import asyncio
+import importlib.util
+import random
+import sys
+import time
+from pathlib import Path
+from types import SimpleNamespace
+
+sys.path.insert(0, ".")
+spec = importlib.util.spec_from_file_location("reactrole", Path(__file__).with_name("reactrole.py"))
+reactrole = importlib.util.module_from_spec(spec)
+spec.loader.exec_module(reactrole)
+
+
+class FakeCursor:
+    def __init__(self, docs):
+        self.docs = iter(docs)
+
+    def __aiter__(self):
+        return self
+
+    async def __anext__(self):
+        try:
+            return next(self.docs)
+        except StopIteration:
+            raise StopAsyncIteration
+
+
+class FakeCollection:
+    """Just enough of a Motor collection for the cog, counting every operation."""
+
+    def __init__(self):
+        self.docs = []
+        self.ops = 0
+
+    @staticmethod
+    def matches(doc, query):
+        return all(doc.get(k) == v for k, v in query.items())
+
+    def find(self, query):
+        self.ops += 1
+        return FakeCursor([d for d in self.docs if self.matches(d, query)])
+
+    async def find_one(self, query):
+        self.ops += 1
+        return next((d for d in self.docs if self.matches(d, query)), None)
+
+    async def insert_one(self, doc):
+        self.ops += 1
+        self.docs.append(doc)
+
+    async def insert_many(self, docs):
+        self.ops += 1
+        self.docs.extend(docs)
+
+    async def update_many(self, query, update):
+        self.ops += 1
+        for doc in self.docs:
+            if self.matches(doc, query):
+                doc.update(update["$set"])
+
+    async def delete_one(self, query):
+        self.ops += 1
+        self.docs = [d for d in self.docs if not self.matches(d, query)]
+
+    async def create_index(self, keys, **options):
+        self.ops += 1
+
+
+class FakeRole:
+    def __init__(self, role_id):
+        self.id = role_id
+
+
+class FakeMember:
+    def __init__(self, member_id, guild, roles):
+        self.id = member_id
+        self.guild = guild
+        self.bot = False
+        self.roles = roles
+
+    async def edit(self, *, roles, reason=None):
+        self.guild.edits += 1
+        self.roles = [self.guild.default_role] + [self.guild.get_role(r.id) for r in roles]
+
+
+class FakeGuild:
+    def __init__(self, guild_id, role_count):
+        self.id = guild_id
+        self.edits = 0
+        self.default_role = FakeRole(guild_id)
+        self.roles = {guild_id: self.default_role}
+        for role_id in range(1000, 1000 + role_count):
+            self.roles[role_id] = FakeRole(role_id)
+        self.members = {}
+
+    def get_role(self, role_id):
+        return self.roles.get(role_id)
+
+    def get_member(self, member_id):
+        return self.members.get(member_id)
+
+
+class FakeEmoji:
+    def __init__(self, name):
+        self.name = name
+        self.id = None
+
+    def __str__(self):
+        return self.name
+
+
+class FakeBot:
+    def __init__(self, guild):
+        self.guild = guild
+        self.db = FakeCollection()
+        self.plugin_db = SimpleNamespace(get_partition=lambda cog: self.db)
+        self.user = SimpleNamespace(id=1)
+
+    def get_guild(self, guild_id):
+        return self.guild if guild_id == self.guild.id else None
+
+    async def wait_until_ready(self):
+        pass
+
+    def add_view(self, view):
+        pass
+
+
+def percentile(samples, pct):
+    samples = sorted(samples)
+    return samples[min(len(samples) - 1, int(len(samples) * pct / 100))]
+
+
+async def run_scenario(panel_size, role_count, member_count, event_count, miss_ratio, seed):
+    rng = random.Random(seed)
+    guild = FakeGuild(10, max(role_count, panel_size) + panel_size)
+    bot = FakeBot(guild)
+    msg_id, other_msg_id = 500, 501
+    emojis = [FakeEmoji(f"e{i}") for i in range(panel_size)]
+    panel_roles = list(guild.roles)[-panel_size:]
+    for emoji, role_id in zip(emojis, panel_roles):
+        bot.db.docs.append(reactrole.ReactionRole.new_mapping(guild.id, 400, msg_id, str(emoji), role_id))
+    plain_roles = [r for r in guild.roles.values() if r.id not in panel_roles and r.id != guild.id]
+    for member_id in range(2, 2 + member_count):
+        roles = [guild.default_role] + rng.sample(plain_roles, min(role_count, len(plain_roles)))
+        guild.members[member_id] = FakeMember(member_id, guild, roles)
+
+    cog = reactrole.ReactionRole(bot)
+    cog.reconcile_on_startup = False
+    cog.role_edits.delay = 0
+    await cog.cog_load()
+    db_ops_start = bot.db.ops
+
+    processing = []
+    handle_reaction = cog.handle_reaction
+
+    async def timed_handle_reaction(payload, added):
+        started = time.perf_counter()
+        await handle_reaction(payload, added)
+        processing.append(time.perf_counter() - started)
+
+    cog.handle_reaction = timed_handle_reaction
+
+    listener = []
+    started = time.perf_counter()
+    for i in range(event_count):
+        payload = SimpleNamespace(
+            guild_id=guild.id,
+            channel_id=400,
+            message_id=other_msg_id if rng.random() < miss_ratio else msg_id,
+            user_id=rng.randrange(2, 2 + member_count),
+            emoji=rng.choice(emojis),
+            member=None,
+        )
+        handler = cog.add_reactrole_handler if rng.random() < 0.6 else cog.remove_reactrole_handler
+        t = time.perf_counter()
+        await handler(payload)
+        listener.append(time.perf_counter() - t)
+        if i % 200 == 199:
+            for queue in cog.event_queues.values():
+                await queue.join()
+    for queue in cog.event_queues.values():
+        await queue.join()
+    await cog.role_edits.close()
+    elapsed = time.perf_counter() - started
+    await cog.cog_unload()
+
+    return {
+        "panel": panel_size,
+        "roles": role_count,
+        "events/s": event_count / elapsed,
+        "listener p50 (us)": percentile(listener, 50) * 1e6,
+        "listener p99 (us)": percentile(listener, 99) * 1e6,
+        "handler p50 (us)": percentile(processing, 50) * 1e6 if processing else 0.0,
+        "handler p99 (us)": percentile(processing, 99) * 1e6 if processing else 0.0,
+        "db ops/event": (bot.db.ops - db_ops_start) / event_count,
+        "edits/event": guild.edits / event_count,
+        "dropped": cog.events_dropped,
+        "coalesced": cog.events_coalesced,
+    }
+
+
+def print_table(rows):
+    columns = list(rows[0])
+    widths = [max(len(c), 10) for c in columns]
+    print("  ".join(c.rjust(w) for c, w in zip(columns, widths)))
+    for row in rows:
+        cells = []
+        for column, width in zip(columns, widths):
+            value = row[column]
+            cells.append((f"{value:.2f}" if isinstance(value, float) else str(value)).rjust(width))
+        print("  ".join(cells))
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--events", type=int, default=10000)
+    parser.add_argument("--members", type=int, default=500)
+    parser.add_argument("--panel-sizes", type=int, nargs="+", default=[1, 10, 50])
+    parser.add_argument("--role-counts", type=int, nargs="+", default=[5, 50, 200])
+    parser.add_argument("--miss-ratio", type=float, default=0.5, help="share of reactions on other messages")
+    parser.add_argument("--seed", type=int, default=0)
+    args = parser.parse_args()
+
+    rows = []
+    for panel_size in args.panel_sizes:
+        for role_count in args.role_counts:
+            rows.append(
+                asyncio.run(
+                    run_scenario(panel_size, role_count, args.members, args.events, args.miss_ratio, args.seed)
+                )
+            )
+    print_table(rows)
+
+
+if __name__ == "__main__":
+    main()
@@ -1,9 +1,19 @@
+import asyncio
+import json
+import time
 import typing
+from collections import defaultdict
+
 import emoji
 
 import discord
 from discord.ext import commands, tasks
 
+from core import checks
+from core.models import PermissionLevel, getLogger
+
+logger = getLogger(__name__)
+
 class UnicodeEmoji(commands.Converter):
     async def convert(self, ctx, argument):
         if argument in emoji.UNICODE_EMOJI:
@@ -12,27 +22,493 @@ class UnicodeEmoji(commands.Converter):
 
 Emoji = typing.Union[discord.PartialEmoji, UnicodeEmoji]
 
+
+def plan_stages(plan):
+    """Yield the stage names of an ``explain()`` query plan."""
+    stack = [plan]
+    while stack:
+        node = stack.pop()
+        if 'stage' in node:
+            yield node['stage']
+        if 'inputStage' in node:
+            stack.append(node['inputStage'])
+        if 'queryPlan' in node:
+            stack.append(node['queryPlan'])
+        stack.extend(node.get('inputStages', ()))
+
+
+class ReactionRoleMapping:
+    """
+    Cached form of a mapping document.
+
+    Role references are parsed once into integers, the whitelist and blacklist
+    into frozensets, so reaction events never touch the stored strings.
+    """
+
+    __slots__ = (
+        'guild_id', 'channel_id', 'msg_id', 'emoji', 'role_id', 'locked', 'drop',
+        'verify', 'reversed', 'limit', 'whitelist', 'blacklist',
+    )
+
+    def __init__(self, doc):
+        self.channel_id = None
+        self.update(doc)
+
+    @property
+    def key(self):
+        return (self.guild_id, self.msg_id, self.emoji)
+
+    def update(self, fields):
+        """Apply document fields, as written with ``$set``."""
+        for field, value in fields.items():
+            if field in ('whitelist', 'blacklist'):
+                value = frozenset(int(r) for r in value)
+            elif field == 'role':
+                field, value = 'role_id', int(value)
+            elif field == 'limit':
+                value = None if value is None else int(value)
+            elif field not in self.__slots__:
+                continue
+            setattr(self, field, value)
+
+
+def resolve_action(mapping, role_ids, added, panel=(frozenset(), None)):
+    """
+    Decide what a reaction means for the mapped role.
+
+    ``role_ids`` is the set of role ids the member holds, ``added`` whether the
+    reaction was added or removed and ``panel`` the message's linked role ids and
+    role limit, as returned by :meth:`ReactionRole.get_panel`.
+
+    Returns True to grant the role, False to revoke it or None to leave it untouched.
+    """
+    if mapping.locked:
+        return None
+    if mapping.whitelist and mapping.whitelist.isdisjoint(role_ids):
+        return None
+    if not mapping.blacklist.isdisjoint(role_ids):
+        return None
+    held = mapping.role_id in role_ids
+    if added:
+        if mapping.drop or (mapping.verify and held):
+            return None
+        grant = not mapping.reversed
+    else:
+        if mapping.verify or (mapping.drop and not held):
+            return None
+        grant = mapping.reversed
+    if grant and not held:
+        linked_roles, limit = panel
+        if limit is not None and len(linked_roles & role_ids) >= limit:
+            return None
+    return grant
+
+
+class RoleEditBatcher:
+    """
+    Coalesces the role changes of a member into a single ``member.edit`` call.
+
+    Changes queued within ``delay`` seconds of the first one are folded together;
+    the latest state wins per role, so a grant followed by a revoke of the same
+    role cancels out and no request is made for it. Edits of the same member run
+    one after another, each on top of what the previous ones set.
+    """
+
+    # Seconds the changes of a finished edit are laid over the member cache, which
+    # only catches up once Discord sends the member update
+    settle_time = 30
+
+    def __init__(self, delay):
+        self.delay = delay
+        self.pending = {}  # (guild_id, member_id) -> {role_id: grant}
+        self.inflight = {}  # changes whose edit request hasn't returned yet
+        self.settled = {}  # changes of the last finished edit, until the cache shows them
+        self.members = {}
+        self.tasks = {}
+        self.locks = {}
+        self.burst_sizes = {}
+        self.requested = 0  # role changes queued
+        self.edits = 0  # member edits actually sent
+
+    @property
+    def saved(self):
+        return self.requested - self.edits
+
+    def queue(self, member, role_id, grant):
+        key = (member.guild.id, member.id)
+        self.pending.setdefault(key, {})[role_id] = grant
+        self.members[key] = member
+        self.burst_sizes[key] = self.burst_sizes.get(key, 0) + 1
+        self.requested += 1
+        if key not in self.tasks:
+            self.tasks[key] = asyncio.create_task(self.flush_later(key))
+
+    async def edit_now(self, member, changes, reason):
+        """Apply ``{role_id: grant}`` right away, together with the member's pending changes."""
+        key = (member.guild.id, member.id)
+        self.pending.setdefault(key, {}).update(changes)
+        self.members[key] = member
+        self.burst_sizes[key] = self.burst_sizes.get(key, 0) + len(changes)
+        self.requested += len(changes)
+        task = self.tasks.pop(key, None)
+        if task is not None:
+            task.cancel()
+        await self.flush(key, reason=reason, raise_errors=True)
+
+    @staticmethod
+    def apply_changes(role_ids, *changes):
+        for role_changes in changes:
+            for role_id, grant in (role_changes or {}).items():
+                if grant:
+                    role_ids.add(role_id)
+                else:
+                    role_ids.discard(role_id)
+        return role_ids
+
+    def effective_role_ids(self, member):
+        """Role ids of ``member`` with its settled, in-flight and pending changes applied."""
+        key = (member.guild.id, member.id)
+        return self.apply_changes(
+            {r.id for r in member.roles}, self.settled.get(key), self.inflight.get(key), self.pending.get(key)
+        )
+
+    async def flush_later(self, key):
+        await asyncio.sleep(self.delay)
+        self.tasks.pop(key, None)
+        await self.flush(key)
+
+    async def flush(self, key, reason="Reaction roles", raise_errors=False):
+        lock = self.locks.setdefault(key, asyncio.Lock())
+        try:
+            async with lock:
+                await self.send_edit(key, reason, raise_errors)
+        finally:
+            # Waiting flushes still find their changes pending, so the lock is only dropped when idle
+            if key not in self.pending and key not in self.tasks and not lock.locked():
+                self.locks.pop(key, None)
+
+    async def send_edit(self, key, reason, raise_errors):
+        changes = self.pending.pop(key, None)
+        member = self.members.pop(key, None)
+        burst = self.burst_sizes.pop(key, 0)
+        if not changes or member is None:
+            return
+        guild = member.guild
+        member = guild.get_member(member.id) or member
+        current = {r.id for r in member.roles}
+        settled = self.settled.get(key)
+        if settled is not None and all((role_id in current) == grant for role_id, grant in settled.items()):
+            settled = self.settled.pop(key)
+        # The previous edit may not be in the cache yet, build on top of it
+        current = self.apply_changes(current, settled)
+        final = self.apply_changes(set(current), changes)
+        if final == current:
+            logger.debug("Dropped %d cancelling role change(s) for %s.", burst, member)
+            return
+        final.discard(guild.id)  # @everyone can't be sent in a role edit
+        self.inflight[key] = changes
+        try:
+            await member.edit(roles=[discord.Object(id=r) for r in final], reason=reason)
+        except discord.HTTPException as e:
+            if raise_errors:
+                raise
+            logger.warning("Failed to update roles of %s: %s", member, e)
+            return
+        finally:
+            self.inflight.pop(key, None)
+        self.edits += 1
+        entry = self.settled[key] = {role_id: role_id in final for role_id in {**(settled or {}), **changes}}
+        asyncio.get_running_loop().call_later(self.settle_time, self.forget_settled, key, entry)
+        logger.debug("Applied %d role change(s) for %s in 1 request, saving %d.", burst, member, burst - 1)
+
+    def forget_settled(self, key, entry):
+        if self.settled.get(key) is entry:
+            del self.settled[key]
+
+    async def close(self):
+        for task in self.tasks.values():
+            task.cancel()
+        self.tasks.clear()
+        for key in list(self.pending):
+            await self.flush(key)
+
+
+class RolePanelButton(discord.ui.Button):
+    """Toggles the role of one mapping, behaves like adding or removing its reaction."""
+
+    def __init__(self, cog, msg_id, emoji, label=None, button_emoji=None):
+        super().__init__(
+            style=discord.ButtonStyle.secondary,
+            label=label,
+            emoji=button_emoji,
+            custom_id=f"rr:b:{msg_id}:{emoji}",
+        )
+        self.cog = cog
+        self.msg_id = msg_id
+        self.emoji_key = emoji
+
+    async def callback(self, interaction):
+        await self.cog.handle_panel_button(interaction, self.msg_id, self.emoji_key)
+
+
+class RolePanelSelect(discord.ui.Select):
+    """Applies the whole selection of a message's roles in one go."""
+
+    def __init__(self, cog, msg_id, options, max_values):
+        super().__init__(
+            custom_id=f"rr:s:{msg_id}",
+            placeholder="Pick your roles",
+            min_values=0,
+            max_values=max_values,
+            options=options,
+        )
+        self.cog = cog
+        self.msg_id = msg_id
+
+    async def callback(self, interaction):
+        await self.cog.handle_panel_select(interaction, self.msg_id, self.values)
+
+
 class ReactionRole(commands.Cog):
+    # (keys, options) of the indexes created at load, the msg_id prefix also serves per-message queries
+    db_indexes = [
+        ([('msg_id', 1), ('guild_id', 1), ('emoji', 1)], {'name': 'msg_guild_emoji'}),
+    ]
+    # Queries run by the plugin at runtime, checked by `rr dbcheck`
+    db_hot_queries = [
+        ('mapping lookup', {'guild_id': '0', 'msg_id': '0', 'emoji': '0'}),
+        ('message mappings', {'msg_id': '0'}),
+    ]
+    # Seconds to wait for more reactions of a member before editing their roles
+    role_edit_delay = 1.5
+    # Reaction events waiting per guild before new ones are dropped
+    queue_size = 1000
+    # Workers draining each guild's event queue
+    workers_per_guild = 2
+    # Seconds between reactions added by the bulk command
+    reaction_delay = 0.3
+    # Catch up on reactions missed while the bot was offline once it is ready
+    reconcile_on_startup = True
+    # Whether that startup pass also revokes roles from members without a reaction;
+    # off so roles handed out by moderators survive restarts, `rr reconcile` always revokes
+    reconcile_revoke_on_startup = False
+    # Messages whose reactors are fetched at the same time while reconciling
+    reconcile_concurrency = 4
+    # Member edits sent at the same time while reconciling
+    reconcile_batch_size = 10
+
     def __init__(self,bot):
         self.bot = bot
         self.db = bot.plugin_db.get_partition(self)
+        # In-memory mirror of the mapping documents as ReactionRoleMapping, keyed by (guild_id, msg_id, emoji).
+        # Reaction events are matched against this instead of querying the database.
+        self.mappings = {}
+        # msg_id -> keys of every mapping that lives on that message
+        self.message_keys = defaultdict(set)
+        # msg_id -> (frozenset of linked role ids, limit), rebuilt when the message's mappings change
+        self.panels = {}
+        # msg_id -> style of the role panel posted for it, persisted so only those views are re-registered
+        self.panel_styles = {}
+        # (guild_id, member_id, role_id) granted through a panel, which leaves no reaction for reconciliation to see
+        self.panel_grants = set()
+        self.role_edits = RoleEditBatcher(self.role_edit_delay)
+        self.event_queues = {}  # guild_id -> queue of event keys
+        self.event_workers = {}  # guild_id -> worker tasks
+        # (guild_id, user_id, msg_id, emoji) -> latest (payload, added) waiting in a queue
+        self.pending_events = {}
+        self.events_dropped = 0
+        self.events_coalesced = 0
+        self.startup_reconcile = None
+
+    async def cog_load(self):
+        for keys, options in self.db_indexes:
+            await self.db.create_index(keys, **options)
+        await self.load_mappings()
+        # Panels are persistent views, register them so clicks on panels posted before a restart still work
+        for msg_id, style in self.panel_styles.items():
+            self.register_panel_view(msg_id, style)
+        if self.reconcile_on_startup:
+            self.startup_reconcile = asyncio.create_task(self.reconcile_after_ready())
+
+    async def reconcile_after_ready(self):
+        await self.bot.wait_until_ready()
+        try:
+            stats = await self.reconcile(revoke=self.reconcile_revoke_on_startup)
+        except Exception:
+            logger.exception("Reaction role reconciliation failed.")
+        else:
+            logger.info("Reaction roles reconciled: %s", self.format_reconcile_stats(stats))
+
+    async def cog_unload(self):
+        if self.startup_reconcile is not None:
+            self.startup_reconcile.cancel()
+        for workers in self.event_workers.values():
+            for worker in workers:
+                worker.cancel()
+        self.event_workers.clear()
+        await self.role_edits.close()
+
+    async def load_mappings(self):
+        """Rebuild the mapping index from the database."""
+        self.mappings.clear()
+        self.message_keys.clear()
+        self.panels.clear()
+        self.panel_styles.clear()
+        self.panel_grants.clear()
+        # Panel bookkeeping shares the collection, told apart from mappings by its type
+        async for doc in self.db.find({}):
+            if doc.get('type') == 'panels':
+                self.panel_styles.update(doc.get('messages', {}))
+            elif doc.get('type') == 'panel_grant':
+                self.panel_grants.add((doc['guild_id'], doc['user_id'], doc['role_id']))
+            elif 'type' not in doc:
+                self.cache_mapping(doc)
+        logger.info("Loaded %d reaction role mapping(s).", len(self.mappings))
+
+    def cache_mapping(self, doc):
+        mapping = ReactionRoleMapping(doc)
+        self.mappings[mapping.key] = mapping
+        self.message_keys[mapping.msg_id].add(mapping.key)
+        self.panels.pop(mapping.msg_id, None)
+
+    def uncache_mapping(self, key):
+        self.mappings.pop(key, None)
+        self.panels.pop(key[1], None)
+        keys = self.message_keys.get(key[1])
+        if keys is not None:
+            keys.discard(key)
+            if not keys:
+                del self.message_keys[key[1]]
+
+    def update_cached_message(self, msg_id, fields):
+        """Apply a ``$set`` that was written to every mapping of a message."""
+        for key in self.message_keys.get(msg_id, ()):
+            self.mappings[key].update(fields)
+        if 'limit' in fields or 'role' in fields:
+            self.panels.pop(msg_id, None)
+
+    def get_panel(self, msg_id):
+        """Return the frozen set of role ids linked to a message and its role limit."""
+        panel = self.panels.get(msg_id)
+        if panel is None:
+            role_ids = []
+            limit = None
+            for key in self.message_keys.get(msg_id, ()):
+                mapping = self.mappings[key]
+                role_ids.append(mapping.role_id)
+                if limit is None:
+                    limit = mapping.limit
+            panel = self.panels[msg_id] = (frozenset(role_ids), limit)
+        return panel
+
+    @staticmethod
+    def emoji_key(emoji):
+        emoji_id = getattr(emoji, 'id', None)
+        return str(emoji) if emoji_id is None else str(emoji_id)
+
+    def get_mapping(self, payload):
+        return self.mappings.get((str(payload.guild_id), str(payload.message_id), self.emoji_key(payload.emoji)))
+
+    def get_event_queue(self, guild_id):
+        queue = self.event_queues.get(guild_id)
+        if queue is None:
+            queue = self.event_queues[guild_id] = asyncio.Queue(maxsize=self.queue_size)
+            self.event_workers[guild_id] = [
+                asyncio.create_task(self.reaction_worker(queue)) for _ in range(self.workers_per_guild)
+            ]
+        return queue
+
+    def enqueue_reaction(self, payload, added):
+        """
+        Queue a reaction event for the guild's workers.
+
+        An event for a (member, message, emoji) that is still waiting in the queue
+        only replaces its state, so rapid add/remove/add sequences are handled once.
+        """
+        if payload.guild_id is None or self.get_mapping(payload) is None:
+            return
+        key = (payload.guild_id, payload.user_id, payload.message_id, self.emoji_key(payload.emoji))
+        if key in self.pending_events:
+            self.pending_events[key] = (payload, added)
+            self.events_coalesced += 1
+            return
+        try:
+            self.get_event_queue(payload.guild_id).put_nowait(key)
+        except asyncio.QueueFull:
+            self.events_dropped += 1
+            return
+        self.pending_events[key] = (payload, added)
+
+    async def reaction_worker(self, queue):
+        while True:
+            key = await queue.get()
+            try:
+                event = self.pending_events.pop(key, None)
+                if event is not None:
+                    await self.handle_reaction(*event)
+            except Exception:
+                logger.exception("Failed to process reaction role event.")
+            finally:
+                queue.task_done()
     
     
     @commands.group(invoke_without_command=True,aliases=['rr'])
     async def reactrole(self,ctx):
         await ctx.send_help(ctx.command)
 
+    @reactrole.command(name="stats")
+    async def stats_rr(self,ctx):
+        edits = self.role_edits
+        depth = sum(queue.qsize() for queue in self.event_queues.values())
+        description = (
+            f"Mappings cached: {len(self.mappings)}\n"
+            f"Queued events: {depth} across {len(self.event_queues)} guild(s)\n"
+            f"Events dropped (queue full): {self.events_dropped}\n"
+            f"Events coalesced: {self.events_coalesced}\n"
+            f"Role changes requested: {edits.requested}\n"
+            f"Role edits sent: {edits.edits}\n"
+            f"Requests saved by batching: {edits.saved}"
+        )
+        embed = discord.Embed(title="Reaction roles stats",description=description)
+        await ctx.send(embed=embed)
+
+    @reactrole.command(name="dbcheck")
+    @checks.has_permissions(PermissionLevel.ADMINISTRATOR)
+    async def dbcheck_rr(self,ctx):
+        """Explain the plugin's database queries and flag collection scans."""
+        lines = []
+        for name, query in self.db_hot_queries:
+            plan = await self.db.find(query).explain()
+            stages = list(plan_stages(plan['queryPlanner']['winningPlan']))
+            flag = "\u26a0\ufe0f" if 'COLLSCAN' in stages else "\u2705"
+            lines.append(f"{flag} {name}: `{' <- '.join(stages)}`")
+        embed = discord.Embed(title="Reaction roles query plans",description="\n".join(lines))
+        await ctx.send(embed=embed)
+
     @reactrole.command(name="lock")
     async def lock_rr(self,ctx,message:discord.Message):
-        self.db.update_many({'msg_id':str(message.id)},{"$set":{"locked":True}})
+        await self.db.update_many({'msg_id':str(message.id)},{"$set":{"locked":True}})
+        self.update_cached_message(str(message.id),{"locked":True})
         await ctx.send(f"Successfully locked react role on that message")
     
     @reactrole.command(name="unlock")
     async def unlock_rr(self,ctx,message:discord.Message):
-        self.db.update_many({'msg_id':str(message.id)},{"$set":{"locked":False}})
+        await self.db.update_many({'msg_id':str(message.id)},{"$set":{"locked":False}})
+        self.update_cached_message(str(message.id),{"locked":False})
         await ctx.send(f"Successfully unlocked react role on that message")
         
         
+    @reactrole.command(name="limit")
+    async def limit_rr(self,ctx,message:discord.Message,limit:int=None):
+        if limit is not None and limit < 1:
+            return await ctx.send("The limit needs to be at least 1!")
+        await self.db.update_many({'msg_id':str(message.id)},{"$set":{"limit":limit}})
+        self.update_cached_message(str(message.id),{"limit":limit})
+        if limit is None:
+            return await ctx.send("Successfully removed the role limit on that message")
+        await ctx.send(f"Members can now pick up to {limit} role(s) on that message")
+        
+        
     @reactrole.command(name="info")
     async def list_rr(self,ctx,message:discord.Message):
         cursor =  self.db.find({"msg_id":str(message.id)})
@@ -64,10 +540,14 @@ class ReactionRole(commands.Cog):
                 reply += f' {role}'
                 role_ids.append(str(role.id))     
             await self.db.update_many({'msg_id':str(message.id)},{"$set":{"blacklist":role_ids}})
+            self.update_cached_message(str(message.id),{"blacklist":role_ids})
             
             await ctx.send(f"Successfully Blacklisted{reply} role(s)!!")
         if not add:
-            current_blacklisted = (await self.db.find_one({'msg_id':str(message.id)}))['blacklist']
+            keys = self.message_keys.get(str(message.id))
+            if not keys:
+                return await ctx.send("There are no reaction roles on that message!")
+            current_blacklisted = [str(r) for r in self.mappings[next(iter(keys))].blacklist]
             reply1=""
             common_roles = []
             for rol in roles:
@@ -83,6 +563,7 @@ class ReactionRole(commands.Cog):
                 if rol1 not in common_roles:
                     new_blacklist.append(rol1)
             await self.db.update_many({'msg_id':str(message.id)},{"$set":{"blacklist":new_blacklist}})
+            self.update_cached_message(str(message.id),{"blacklist":new_blacklist})
             await ctx.send(f"Succefully removed{reply1} from Blacklist!")
         
                 
@@ -101,192 +582,446 @@ class ReactionRole(commands.Cog):
         'msg_id':str(message.id),
         'emoji':emote
         })
+        self.uncache_mapping((str(ctx.guild.id),str(message.id),emote))
         await message.remove_reaction(emoji,member)  
         await ctx.send(f'Removed {emoji} for role {role}')    
          
     @reactrole.command(name="add",aliases=["+"])
     async def add_reactrole(self,ctx,message:discord.Message,emoji:Emoji,role:discord.Role):
         emote = str(emoji) if emoji.id is None else str(emoji.id)
-        await self.db.insert_one({
-        'guild_id':str(ctx.guild.id),
-        'msg_id':str(message.id),
-        'emoji':emote,
-        'role':str(role.id),
-        'locked':False,
-        'drop':False,
-        'blacklist':[],
-        'whitelist':[],
-        'verify':False,
-        'limit':None,
-        'reversed':False,
-        })
+        doc = self.new_mapping(ctx.guild.id,message.channel.id,message.id,emote,role.id)
+        await self.db.insert_one(doc)
+        self.cache_mapping(doc)
         await message.add_reaction(emoji)
         await ctx.send(f'Added {emoji} for the role {role}')
         
     
     
-    @commands.Cog.listener('on_raw_reaction_remove')
-    async def remove_reactrole_handler(self, payload):
-        print("reaction removed")
-        if payload.guild_id is None:
-            return
-            
-        guild = self.bot.get_guild(payload.guild_id)
-        member = guild.get_member(payload.user_id)
-        
-        if member.bot:
-            return
-        emoji = str(payload.emoji) if payload.emoji.id is None else str(payload.emoji.id)
-        data = await self.db.find_one(
-        {
-        'guild_id':str(payload.guild_id),
-        'msg_id':str(payload.message_id),
-        'emoji':emoji
-        })
-        print(data)
-        if not data:
+    @reactrole.command(name="bulk")
+    async def bulk_reactrole(self,ctx,message:discord.Message,*,pairs:str=None):
+        """
+        Add many emoji/role pairs to a message at once.
+
+        Pairs are given as `emoji role emoji role ...` and/or as an attached JSON file,
+        either an object (`{"emoji": "role"}`) or a list of `["emoji", "role"]` pairs.
+        Roles can be given by ID, mention or name.
+        """
+        raw_pairs = []
+        if ctx.message.attachments:
+            try:
+                data = json.loads(await ctx.message.attachments[0].read())
+                items = data.items() if isinstance(data,dict) else data
+                raw_pairs.extend((str(e),str(r)) for e,r in items)
+            except (ValueError,TypeError,discord.HTTPException):
+                return await ctx.send("The attached file is not a valid JSON list of emoji/role pairs!")
+        if pairs:
+            tokens = pairs.split()
+            if len(tokens) % 2:
+                return await ctx.send("Every emoji needs a role!")
+            raw_pairs.extend(zip(tokens[::2],tokens[1::2]))
+        if not raw_pairs:
+            return await ctx.send_help(ctx.command)
+
+        docs = []
+        emojis = []
+        failed = []
+        seen = set()
+        for raw_emoji,raw_role in raw_pairs:
+            try:
+                emoji = await self.convert_emoji(ctx,raw_emoji)
+                role = await commands.RoleConverter().convert(ctx,raw_role)
+            except commands.BadArgument as e:
+                failed.append(f"{raw_emoji} {raw_role}: {e}")
+                continue
+            emote = str(emoji) if emoji.id is None else str(emoji.id)
+            key = (str(ctx.guild.id),str(message.id),emote)
+            if key in seen or key in self.mappings:
+                failed.append(f"{raw_emoji} {raw_role}: emoji is already mapped on that message")
+                continue
+            seen.add(key)
+            docs.append(self.new_mapping(ctx.guild.id,message.channel.id,message.id,emote,role.id))
+            emojis.append((emoji,role))
+        if docs:
+            await self.db.insert_many(docs)
+            for doc in docs:
+                self.cache_mapping(doc)
+
+        # Reactions share a tight per-channel rate limit, pace them instead of bursting into 429s
+        for emoji,role in emojis:
+            try:
+                await message.add_reaction(emoji)
+            except discord.HTTPException as e:
+                failed.append(f"{emoji} {role}: mapped, but reacting failed ({e.text or e.status})")
+            await asyncio.sleep(self.reaction_delay)
+
+        description = f"Added {len(docs)} reaction role(s) to [the message]({message.jump_url})."
+        if failed:
+            description += "\n\n**Failed:**\n" + "\n".join(failed)
+        embed = discord.Embed(title="Bulk reaction roles",description=description[:4096])
+        await ctx.send(embed=embed)
+
+    async def convert_emoji(self, ctx, argument):
+        try:
+            return await commands.PartialEmojiConverter().convert(ctx, argument)
+        except commands.BadArgument:
+            return await UnicodeEmoji().convert(ctx, argument)
+
+    @staticmethod
+    def new_mapping(guild_id, channel_id, msg_id, emote, role_id):
+        return {
+            'guild_id':str(guild_id),
+            'channel_id':str(channel_id),
+            'msg_id':str(msg_id),
+            'emoji':emote,
+            'role':str(role_id),
+            'locked':False,
+            'drop':False,
+            'blacklist':[],
+            'whitelist':[],
+            'verify':False,
+            'limit':None,
+            'reversed':False,
+        }
+
+    @reactrole.command(name="panel")
+    async def panel_rr(self,ctx,message:discord.Message,style:str="buttons",*,title:str="Pick your roles"):
+        """
+        Post a button or select menu panel for the reaction roles of a message.
+
+        The panel uses the same mappings and rules (locked, verify, drop, limit, reversed)
+        as the reactions on that message. Members see right away whether their click worked,
+        and a select menu applies the whole selection with a single role update.
+
+        Styles: `buttons`, `select`
+        """
+        style = style.lower()
+        if style not in ("buttons","select"):
+            return await ctx.send("The style needs to be either `buttons` or `select`!")
+        msg_id = str(message.id)
+        if msg_id not in self.message_keys:
+            return await ctx.send("There are no reaction roles on that message!")
+        if len(self.message_keys[msg_id]) > 25:
+            return await ctx.send("Panels can hold up to 25 roles!")
+        view = self.build_panel_view(msg_id,style,ctx.guild)
+        self.bot.add_view(view)
+        if self.panel_styles.get(msg_id) != style:
+            self.panel_styles[msg_id] = style
+            await self.db.update_one(
+                {'_id':'panels'},{"$set":{'type':'panels',f'messages.{msg_id}':style}},upsert=True
+            )
+        description = "\n".join(
+            f"{self.panel_emoji(m.emoji) or ''} {ctx.guild.get_role(m.role_id)}"
+            for m in self.panel_mappings(msg_id,ctx.guild)
+        )
+        embed = discord.Embed(title=title,description=description)
+        await ctx.send(embed=embed,view=view)
+
+    def panel_mappings(self, msg_id, guild=None):
+        mappings = [self.mappings[key] for key in self.message_keys.get(msg_id, ())]
+        if guild is None:
+            return sorted(mappings, key=lambda m: m.emoji)
+        # Highest role first, like the member list
+        return sorted(mappings, key=lambda m: getattr(guild.get_role(m.role_id), 'position', -1), reverse=True)
+
+    def panel_emoji(self, emoji):
+        if emoji.isdigit():
+            return self.bot.get_emoji(int(emoji))
+        return emoji
+
+    def build_panel_view(self, msg_id, style, guild=None):
+        """
+        Build the persistent view of a message's panel.
+
+        Without a guild, role names are left out; that is enough to register the view
+        for dispatch since interactions are matched by custom id.
+        """
+        view = discord.ui.View(timeout=None)
+        mappings = self.panel_mappings(msg_id, guild)
+        labels = {
+            m.emoji: (str(guild.get_role(m.role_id)) if guild is not None else m.emoji)[:80] for m in mappings
+        }
+        if style == "select":
+            _, limit = self.get_panel(msg_id)
+            options = [
+                discord.SelectOption(label=labels[m.emoji], value=m.emoji, emoji=self.panel_emoji(m.emoji))
+                for m in mappings
+            ]
+            max_values = len(options) if limit is None else min(limit, len(options))
+            view.add_item(RolePanelSelect(self, msg_id, options, max_values))
+        else:
+            for m in mappings:
+                view.add_item(RolePanelButton(self, msg_id, m.emoji, labels[m.emoji], self.panel_emoji(m.emoji)))
+        return view
+
+    def register_panel_view(self, msg_id, style):
+        if not 0 < len(self.message_keys.get(msg_id, ())) <= 25:
             return
-        role_id = int(data["role"])
-        role = guild.get_role(role_id)
-        roles = member.roles
-        blacklisted = False
-        allowed = True if data['whitelist'] == [] else False
-        if not allowed:
-            for rol in roles:
-                if str(rol.id) in data['whitelist']:
-                    allowed = True
-                    return
-        for rol1 in roles:
-            if str(rol1.id) in data['blacklist']:
-                blacklisted = True
+        self.bot.add_view(self.build_panel_view(msg_id, style))
+
+    async def record_panel_changes(self, member, changes):
+        """Remember roles granted through a panel, so reconciliation doesn't revoke them for lack of a reaction."""
+        for role_id, grant in changes.items():
+            key = (member.guild.id, member.id, role_id)
+            if grant == (key in self.panel_grants):
+                continue
+            doc_id = 'panel_grant:%d:%d:%d' % key
+            if grant:
+                self.panel_grants.add(key)
+                fields = {'type':'panel_grant','guild_id':key[0],'user_id':key[1],'role_id':key[2]}
+                await self.db.update_one({'_id':doc_id},{"$set":fields},upsert=True)
+            else:
+                self.panel_grants.discard(key)
+                await self.db.delete_one({'_id':doc_id})
+
+    async def edit_member_roles(self, member, changes, reason):
+        """Apply ``{role_id: grant}`` to a member with a single edit, in line with its batched changes."""
+        await self.role_edits.edit_now(member, changes, reason)
+
+    async def handle_panel_button(self, interaction, msg_id, emoji):
+        await interaction.response.defer(ephemeral=True)
+        member = interaction.user
+        mapping = self.mappings.get((str(interaction.guild_id), msg_id, emoji))
+        role = None if mapping is None else interaction.guild.get_role(mapping.role_id)
+        if role is None:
+            return await interaction.followup.send("This role is no longer available.", ephemeral=True)
+        role_ids = self.role_edits.effective_role_ids(member)
+        held = role.id in role_ids
+        # A click on a held role counts as removing the reaction, otherwise as adding it;
+        # reversed mappings revoke on add, so there it's the other way around
+        added = held if mapping.reversed else not held
+        grant = resolve_action(mapping, role_ids, added, self.get_panel(msg_id))
+        if grant is None or grant == held:
+            return await interaction.followup.send(f"You can't change {role.mention} right now.", ephemeral=True)
+        try:
+            await self.edit_member_roles(member, {role.id: grant}, "Reaction roles panel")
+        except discord.HTTPException:
+            return await interaction.followup.send("Failed to update your roles.", ephemeral=True)
+        await self.record_panel_changes(member, {role.id: grant})
+        verb = "Added" if grant else "Removed"
+        await interaction.followup.send(f"{verb} {role.mention}.", ephemeral=True)
+
+    async def handle_panel_select(self, interaction, msg_id, values):
+        await interaction.response.defer(ephemeral=True)
+        member = interaction.user
+        selected = set(values)
+        role_ids = self.role_edits.effective_role_ids(member)
+        panel = self.get_panel(msg_id)
+        changes = {}
+        mappings = [self.mappings[key] for key in self.message_keys.get(msg_id, ())]
+        # Deselections first, so they free up room under the limit for new picks
+        for added in (False, True):
+            for mapping in mappings:
+                if (mapping.emoji in selected) != added:
+                    continue
+                held = mapping.role_id in role_ids
+                if added == held and not mapping.reversed:
+                    continue
+                grant = resolve_action(mapping, role_ids, added, panel)
+                if grant is None or grant == held:
+                    continue
+                if grant:
+                    role_ids.add(mapping.role_id)
+                else:
+                    role_ids.discard(mapping.role_id)
+                changes[mapping.role_id] = grant
+        if not changes:
+            return await interaction.followup.send("Your roles are already up to date.", ephemeral=True)
+        try:
+            await self.edit_member_roles(member, changes, "Reaction roles panel")
+        except discord.HTTPException:
+            return await interaction.followup.send("Failed to update your roles.", ephemeral=True)
+        await self.record_panel_changes(member, changes)
+        lines = [f"{'Added' if grant else 'Removed'} <@&{role_id}>" for role_id, grant in changes.items()]
+        await interaction.followup.send("\n".join(lines), ephemeral=True)
+
+    @reactrole.command(name="reconcile",aliases=["sync"])
+    async def reconcile_rr(self,ctx,message:discord.Message=None):
+        """
+        Bring member roles in line with the current reactions.
+
+        Grants roles to members who reacted and revokes them from members who hold
+        a role without reacting, following the same rules as live reactions.
+        A role linked on several messages or emojis is only revoked from members who
+        reacted on none of them, and only when all of those messages are checked.
+        Without a message, every reaction role message of this server is checked.
+        """
+        if message is not None and str(message.id) not in self.message_keys:
+            return await ctx.send("There are no reaction roles on that message!")
+        status = await ctx.send("Reconciling reaction roles...")
+
+        async def progress(stats):
+            await status.edit(content=f"Reconciling reaction roles... {self.format_reconcile_stats(stats)}")
+
+        msg_ids = None if message is None else [str(message.id)]
+        stats = await self.reconcile(guild_ids={str(ctx.guild.id)},msg_ids=msg_ids,progress=progress)
+        await status.edit(content=f"Reconciliation finished. {self.format_reconcile_stats(stats)}")
+
+    @staticmethod
+    def format_reconcile_stats(stats):
+        elapsed = max(stats['elapsed'], 1e-9)
+        return (
+            f"{stats['messages']} message(s), {stats['skipped']} skipped, "
+            f"{stats['reactors']} reactor(s) scanned ({stats['reactors'] / elapsed:.0f}/s), "
+            f"{stats['grants']} grant(s), {stats['revokes']} revocation(s), "
+            f"{stats['edits']}/{stats['members']} member(s) updated, {stats['failed']} failed "
+            f"in {stats['elapsed']:.1f}s"
+        )
+
+    async def reconcile(self, guild_ids=None, msg_ids=None, progress=None, revoke=True):
+        """
+        Diff the reactions on reaction role messages against member roles and apply what's missing.
+
+        Reactors are paged per message with at most ``reconcile_concurrency`` messages in flight,
+        then every changed member gets a single role edit, ``reconcile_batch_size`` at a time.
+        Decisions are made per role once every message is scanned, so the result doesn't
+        depend on the order the scans finish in.
+        """
+        started = time.perf_counter()
+        stats = dict.fromkeys(
+            ('messages', 'skipped', 'reactors', 'grants', 'revokes', 'members', 'edits', 'failed', 'elapsed'), 0
+        )
+        role_states = {}  # (guild_id, member_id) -> role ids with the decided changes applied
+        changes = {}  # (guild_id, member_id) -> {role_id: grant}
+        members = {}
+        scanned = defaultdict(list)  # (guild_id, role_id) -> [(mapping, {member_id: member} of its reactors)]
+        semaphore = asyncio.Semaphore(self.reconcile_concurrency)
+
+        def decide(member, mappings, role, added):
+            key = (member.guild.id, member.id)
+            role_ids = role_states.get(key)
+            if role_ids is None:
+                role_ids = role_states[key] = {r.id for r in member.roles}
+            # With several mappings for the role, act only when they all agree
+            grants = {resolve_action(data, role_ids, added, self.get_panel(data.msg_id)) for data in mappings}
+            if len(grants) != 1:
                 return
-        action = member.remove_roles
-        if data['locked']:
-            action = None
-            print("Locked")
-        if blacklisted:
-            action = None
-            print("Blacklisted")
-        if not allowed:
-            action = None 
-            print("Not allowed")               
-        if data['drop']:
-            if role not in roles:
-                action = None
-                print("Drop")
-        if data['verify']:            
-            action = None
-            print("Verify")
-        linked_roles = []
-        if data['limit'] != None:
-            limit = int(data['limit'])
-            cursor = await self.db.find({'message_id':str(payload.message_id)})
-            async for doc in cursor:
-                linked_roles.append(doc['role'])
-            num = len(linked_roles)
-            if limit > num:
+            grant = grants.pop()
+            if grant is None or grant == (role.id in role_ids):
                 return
+            if grant:
+                role_ids.add(role.id)
+                stats['grants'] += 1
             else:
-                common = 0
-                for rol2 in roles:
-                    if str(rol2.id) in linked_roles:
-                        common +=1
-                if common > limit:
-                    action=None
-                    print("limit")
-        if action != None:
-            if data['reversed']:
-                action = member.add_roles
-            await action(role)
-            #print(role)
-            print(action)
-        else:
-            print("Action none")
-                        
-    @commands.Cog.listener('on_raw_reaction_add')                
-    async def add_reactrole_handler(self, payload):
-        if payload.guild_id is None:
+                role_ids.discard(role.id)
+                stats['revokes'] += 1
+            changes.setdefault(key, {})[role.id] = grant
+            members[key] = member
+
+        async def scan(msg_id):
+            async with semaphore:
+                docs = [self.mappings[key] for key in self.message_keys.get(msg_id, ())]
+                if not docs:
+                    return
+                guild = self.bot.get_guild(int(docs[0].guild_id))
+                channel_id = docs[0].channel_id
+                channel = None if guild is None or channel_id is None else guild.get_channel_or_thread(int(channel_id))
+                if channel is None:
+                    stats['skipped'] += 1
+                    return
+                try:
+                    message = await channel.fetch_message(int(msg_id))
+                except discord.HTTPException:
+                    stats['skipped'] += 1
+                    return
+                reactions = {self.emoji_key(r.emoji): r for r in message.reactions}
+                for data in docs:
+                    if guild.get_role(data.role_id) is None:
+                        continue
+                    reactors = {}
+                    reaction = reactions.get(data.emoji)
+                    if reaction is not None:
+                        async for user in reaction.users():
+                            stats['reactors'] += 1
+                            member = guild.get_member(user.id)
+                            if member is not None and not member.bot:
+                                reactors[member.id] = member
+                    scanned[(guild.id, data.role_id)].append((data, reactors))
+                stats['messages'] += 1
+
+        if msg_ids is None:
+            msg_ids = [
+                msg_id for msg_id, keys in self.message_keys.items()
+                if guild_ids is None or next(iter(keys))[0] in guild_ids
+            ]
+        await asyncio.gather(*(scan(msg_id) for msg_id in msg_ids))
+
+        linked = defaultdict(int)  # (guild_id, role_id) -> number of mappings linking it
+        for data in self.mappings.values():
+            linked[(int(data.guild_id), data.role_id)] += 1
+        for (guild_id, role_id), entries in sorted(scanned.items()):
+            role = self.bot.get_guild(guild_id).get_role(role_id)
+            entries.sort(key=lambda entry: entry[0].key)
+            reacted = set()
+            for data, reactors in entries:
+                for member_id in sorted(reactors):
+                    decide(reactors[member_id], [data], role, True)
+                reacted.update(reactors)
+            # A message that wasn't scanned may hold the reaction that keeps the role
+            if not revoke or len(entries) < linked[(guild_id, role_id)]:
+                continue
+            mappings = [data for data, _ in entries]
+            for member in role.members:
+                if member.id in reacted or member.bot or (guild_id, member.id, role_id) in self.panel_grants:
+                    continue
+                decide(member, mappings, role, False)
+
+        async def apply(key):
+            member = members[key]
+            try:
+                await self.edit_member_roles(member, changes[key], "Reaction roles reconciliation")
+            except discord.HTTPException as e:
+                stats['failed'] += 1
+                logger.warning("Failed to reconcile roles of %s: %s", member, e)
+            else:
+                stats['edits'] += 1
+
+        keys = list(changes)
+        stats['members'] = len(keys)
+        for i in range(0, len(keys), self.reconcile_batch_size):
+            await asyncio.gather(*(apply(key) for key in keys[i:i + self.reconcile_batch_size]))
+            stats['elapsed'] = time.perf_counter() - started
+            if progress is not None:
+                await progress(stats)
+        stats['elapsed'] = time.perf_counter() - started
+        return stats
+
+    async def handle_reaction(self, payload, added):
+        data = self.get_mapping(payload)
+        if not data:
             return
-            
+        if data.channel_id is None:
+            # Mappings created before channels were stored, reconciliation needs it to find the message
+            fields = {'channel_id':str(payload.channel_id)}
+            self.update_cached_message(data.msg_id, fields)
+            await self.db.update_many({'msg_id':data.msg_id},{"$set":fields})
         guild = self.bot.get_guild(payload.guild_id)
+        if guild is None:
+            return
         member = guild.get_member(payload.user_id)
-        if member.bot:
+        if member is None or member.bot:
             return
-        emoji = str(payload.emoji) if payload.emoji.id is None else str(payload.emoji.id)
-        data = await self.db.find_one(
-        {
-        'guild_id':str(payload.guild_id),
-        'msg_id':str(payload.message_id),
-        'emoji':emoji
-        })
-        print(f'{payload.emoji}')
-        if not data:
-            
+        role = guild.get_role(data.role_id)
+        if role is None:
             return
-        role_id = int(data["role"])
-        role = guild.get_role(role_id)
-        print(role)
-        roles = member.roles
-        blacklisted = False
-        allowed = True if data['whitelist'] == [] else False
-        if not allowed:
-            for rol in roles:
-                if str(rol.id) in data['whitelist']:
-                    allowed = True
-                    return
-        for rol1 in roles:
-            if str(rol1.id) in data['blacklist']:
-                blacklisted = True
-                return
-        action = member.add_roles 
-        if data['locked']:
-            action = None
-            print('Locked is True')
-        if blacklisted:
-            action = None
-            print('Blacklisted is True')
-        if not allowed:
-            action = None
-            print('Allowed is True')                
-        if data['drop']:            
-            action = None
-            print('Drop is true')
-        if data['verify']:
-            if role in roles:
-                action = None
-                print('Verify is true')
-        linked_roles = []
-        if data['limit'] != None:
-            limit = int(data['limit'])
-            cursor = await self.db.find({'message_id':str(payload.message_id)})
-            async for doc in cursor:
-                linked_roles.append(doc['role'])
-            num = len(linked_roles)
-            if limit > num:
-                return
-            else:
-                common = 0
-                for rol2 in roles:
-                    if str(rol2.id) in linked_roles:
-                        common +=1
-                if common > limit:
-                    action=None
-                    print('Common > Limit')
-        if action != None:
-            if data['reversed']:
-                action = member.remove_roles
-            await action(role)  
-            print(role)       
-        else:
-            print('Action is None')
-        
-            
-                
-                
-            
-               
-def setup(bot):
-    bot.add_cog(ReactionRole(bot))            
+        # Decide against the roles the member will have once pending edits land
+        role_ids = self.role_edits.effective_role_ids(member)
+        grant = resolve_action(data, role_ids, added, self.get_panel(data.msg_id))
+        if grant is not None:
+            self.role_edits.queue(member, role.id, grant)
+            if not grant and (guild.id, member.id, role.id) in self.panel_grants:
+                await self.record_panel_changes(member, {role.id: False})
+
+    @commands.Cog.listener('on_raw_reaction_remove')
+    async def remove_reactrole_handler(self, payload):
+        self.enqueue_reaction(payload, False)
+
+    @commands.Cog.listener('on_raw_reaction_add')
+    async def add_reactrole_handler(self, payload):
+        self.enqueue_reaction(payload, True)
+
+
+async def setup(bot):
+    await bot.add_cog(ReactionRole(bot))            
             
               
         
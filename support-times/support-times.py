@@ -1,12 +1,18 @@
 from collections import defaultdict
 from datetime import datetime, timedelta, timezone
 from typing import Optional, Union
+import asyncio
+import bisect
+import copy
+import functools
+import heapq
+import itertools
 import os
+import time
 
 import discord
 from discord.ext import commands, tasks
 from discord import utils
-import aiocron
 import croniter
 import pytz
 
@@ -18,6 +24,254 @@ from core.paginator import EmbedPaginatorSession, MessagePaginatorSession
 logger = getLogger(__name__)
 
 
+def plan_stages(plan):
+    """Yield the stage names of an ``explain()`` query plan."""
+    stack = [plan]
+    while stack:
+        node = stack.pop()
+        if "stage" in node:
+            yield node["stage"]
+        if "inputStage" in node:
+            stack.append(node["inputStage"])
+        if "queryPlan" in node:
+            stack.append(node["queryPlan"])
+        stack.extend(node.get("inputStages", ()))
+
+
+def cron_next_fire(cron: str, tz):
+    """Returns a function giving the first fire time of ``cron`` after a datetime, in ``tz`` (``None`` = system time)."""
+
+    def next_fire(after: datetime) -> datetime:
+        return croniter.croniter(cron, after.astimezone(tz)).get_next(datetime)
+
+    return next_fire
+
+
+MINUTES_PER_DAY = 24 * 60
+MINUTES_PER_WEEK = 7 * MINUTES_PER_DAY
+
+
+@functools.lru_cache(maxsize=256)
+def cron_slots(cron: str) -> tuple:
+    """
+    Returns ``(slots, weekly)`` with the sorted minutes of the week (0 = Monday 00:00) ``cron`` can fire at.
+
+    ``weekly`` is False for expressions that restrict the day of month or the month, or pick an
+    nth or last weekday of the month (``5#2``, ``5L``); for those the slots are only candidates
+    that need to be checked against the actual date.
+    """
+    parsed = croniter.croniter(cron)
+    minutes, hours, days, months, weekdays = parsed.expanded[:5]
+    weekday_field = cron.split()[4].lower()
+    weekly = (
+        days == ["*"]
+        and months == ["*"]
+        and not parsed.nth_weekday_of_month
+        and "#" not in weekday_field
+        and "l" not in weekday_field
+    )
+    minutes = range(60) if minutes == ["*"] else minutes
+    hours = range(24) if hours == ["*"] else hours
+    # cron counts weekdays from Sunday (0 or 7), Python from Monday
+    if weekdays == ["*"] or not weekly:
+        weekdays = range(7)
+    else:
+        weekdays = {(int(d) - 1) % 7 for d in weekdays}
+    slots = tuple(sorted(d * MINUTES_PER_DAY + h * 60 + m for d in weekdays for h in hours for m in minutes))
+    return slots, weekly
+
+
+def weekly_slots(cron: str) -> Optional[tuple]:
+    """Returns the minutes of the week ``cron`` fires at, ``None`` if it doesn't repeat weekly."""
+    slots, weekly = cron_slots(cron)
+    return slots if weekly else None
+
+
+def localize(naive: datetime, tz) -> datetime:
+    """Attaches ``tz`` (``None`` = system time) to a naive local datetime."""
+    return tz.localize(naive) if tz is not None else naive.astimezone()
+
+
+class WeeklyHours:
+    """
+    Precomputed open/closed state for every minute of the week.
+
+    The enable and disable schedules are compiled into a 10,080 slot bitmap, so the state
+    at any time is a single lookup and the next transition a binary search over the
+    minutes where the state flips. Schedules that don't repeat weekly are left out.
+    """
+
+    def __init__(self, enable: list, disable: list, tz):
+        self.tz = tz
+        self.skipped = []
+        events = {}  # slot -> state, disables win over enables firing at the same minute
+        for state, crons in ((True, enable), (False, disable)):
+            for cron in crons:
+                slots = weekly_slots(cron)
+                if slots is None:
+                    self.skipped.append(cron)
+                    continue
+                for slot in slots:
+                    events[slot] = events.get(slot, True) and state
+        self.bitmap = None
+        self.changes = []
+        if not events:
+            return
+        # The week wraps around, so it starts in the state left by its last transition
+        state = events[max(events)]
+        self.bitmap = bytearray(MINUTES_PER_WEEK)
+        for slot in range(MINUTES_PER_WEEK):
+            state = events.get(slot, state)
+            self.bitmap[slot] = state
+        self.changes = [
+            slot for slot in range(MINUTES_PER_WEEK) if self.bitmap[slot] != self.bitmap[slot - 1]
+        ]
+
+    def slot(self, at: datetime) -> tuple:
+        local = at.astimezone(self.tz)
+        return local, local.weekday() * MINUTES_PER_DAY + local.hour * 60 + local.minute
+
+    def is_open(self, at: datetime) -> Optional[bool]:
+        """Whether the schedules have support open at ``at``, ``None`` without schedules."""
+        if self.bitmap is None:
+            return None
+        return bool(self.bitmap[self.slot(at)[1]])
+
+    def next_transition(self, at: datetime) -> Optional[tuple]:
+        """Returns ``(when, opens)`` for the first state change after ``at``."""
+        if not self.changes:
+            return None
+        local, slot = self.slot(at)
+        idx = bisect.bisect_right(self.changes, slot)
+        target = self.changes[idx] if idx < len(self.changes) else self.changes[0] + MINUTES_PER_WEEK
+        naive = local.replace(tzinfo=None, second=0, microsecond=0) + timedelta(minutes=target - slot)
+        return localize(naive, self.tz), bool(self.bitmap[target % MINUTES_PER_WEEK])
+
+    def previous_transition(self, at: datetime) -> Optional[tuple]:
+        """Returns ``(when, opens)`` for the last state change at or before ``at``."""
+        if not self.changes:
+            return None
+        local, slot = self.slot(at)
+        idx = bisect.bisect_right(self.changes, slot) - 1
+        target = self.changes[idx] if idx >= 0 else self.changes[-1] - MINUTES_PER_WEEK
+        naive = local.replace(tzinfo=None, second=0, microsecond=0) - timedelta(minutes=slot - target)
+        return localize(naive, self.tz), bool(self.bitmap[target % MINUTES_PER_WEEK])
+
+
+class ExceptionCalendar:
+    """
+    Date range exceptions overriding the schedules.
+
+    Exceptions are flattened into disjoint segments between their sorted start and end
+    timestamps, overlaps are won by the exception added last. Looking up the exception
+    active at a time, or the next boundary, is a binary search over the segment bounds.
+    """
+
+    def __init__(self, exceptions: list):
+        self.bounds = sorted({e["start"] for e in exceptions} | {e["end"] for e in exceptions})
+        self.segments = []  # exception active in [bounds[i], bounds[i + 1]), or None
+        order = sorted(range(len(exceptions)), key=lambda i: exceptions[i]["start"])
+        active = []  # max-heap of the indexes of exceptions covering the current segment
+        pos = 0
+        for bound in self.bounds[:-1]:
+            while pos < len(order) and exceptions[order[pos]]["start"] <= bound:
+                heapq.heappush(active, -order[pos])
+                pos += 1
+            while active and exceptions[-active[0]]["end"] <= bound:
+                heapq.heappop(active)
+            self.segments.append(exceptions[-active[0]] if active else None)
+
+    def at(self, timestamp: float) -> Optional[dict]:
+        """Returns the exception active at ``timestamp``, if any."""
+        idx = bisect.bisect_right(self.bounds, timestamp) - 1
+        if 0 <= idx < len(self.segments):
+            return self.segments[idx]
+        return None
+
+    def next_boundary(self, timestamp: float) -> Optional[float]:
+        idx = bisect.bisect_right(self.bounds, timestamp)
+        return self.bounds[idx] if idx < len(self.bounds) else None
+
+    def previous_boundary(self, timestamp: float) -> Optional[float]:
+        idx = bisect.bisect_right(self.bounds, timestamp) - 1
+        return self.bounds[idx] if idx >= 0 else None
+
+
+class ScheduleEngine:
+    """
+    Runs every schedule from a single timer.
+
+    Jobs are kept in a min-heap ordered by their next fire time. The engine sleeps until
+    the earliest one, runs it and pushes its following fire time back onto the heap.
+    Jobs are identified by a key; syncing a new set of jobs only touches the keys that
+    were added or removed, removed jobs are dropped lazily when they reach the top of the heap.
+    """
+
+    def __init__(self):
+        self.jobs = {}  # key -> (next_fire, callback, generation)
+        self.heap = []  # (timestamp, generation, key)
+        self.generation = itertools.count()
+        self.wakeup = asyncio.Event()
+        self.task = None
+
+    def start(self):
+        if self.task is None or self.task.done():
+            self.task = asyncio.create_task(self.run())
+
+    def stop(self):
+        if self.task is not None:
+            self.task.cancel()
+            self.task = None
+
+    def sync(self, jobs: dict):
+        """Replaces the jobs with ``{key: (next_fire, callback)}``, only re-arming changed keys."""
+        changed = False
+        for key in self.jobs.keys() - jobs.keys():
+            del self.jobs[key]
+            changed = True
+        now = discord.utils.utcnow()
+        for key, (next_fire, callback) in jobs.items():
+            if key in self.jobs:
+                continue
+            generation = next(self.generation)
+            self.jobs[key] = (next_fire, callback, generation)
+            fire_at = next_fire(now)
+            if fire_at is not None:
+                heapq.heappush(self.heap, (fire_at.timestamp(), generation, key))
+            changed = True
+        if changed:
+            self.wakeup.set()
+
+    def is_current(self, entry) -> bool:
+        job = self.jobs.get(entry[2])
+        return job is not None and job[2] == entry[1]
+
+    async def run(self):
+        while True:
+            self.wakeup.clear()
+            while self.heap and not self.is_current(self.heap[0]):
+                heapq.heappop(self.heap)
+            if not self.heap:
+                await self.wakeup.wait()
+                continue
+            delay = self.heap[0][0] - discord.utils.utcnow().timestamp()
+            if delay > 0:
+                try:
+                    await asyncio.wait_for(self.wakeup.wait(), timeout=delay)
+                except asyncio.TimeoutError:
+                    pass
+                continue
+            timestamp, generation, key = heapq.heappop(self.heap)
+            next_fire, callback, _ = self.jobs[key]
+            fire_at = next_fire(datetime.fromtimestamp(timestamp, timezone.utc))
+            if fire_at is not None:
+                heapq.heappush(self.heap, (fire_at.timestamp(), generation, key))
+            try:
+                await callback()
+            except Exception:
+                logger.exception("Schedule %s failed.", key)
+
+
 class SupportTimes(commands.Cog):
     """
     Operating Hours Ticket System 
@@ -26,6 +280,15 @@ class SupportTimes(commands.Cog):
     Practical for regular support times / business hours.
     """
 
+    # The config is a single document fetched by _id, which Mongo always indexes
+    db_indexes = []
+    # Queries run by the plugin at runtime, checked by `support-times dbcheck`
+    db_hot_queries = [("config", {"_id": "support-times"})]
+    # Seconds to wait for further config edits before writing them
+    config_write_delay = 3
+    # Seconds before the closed-hours responder replies to the same user again
+    responder_cooldown = 600
+
     def __init__(self, bot):
         self.bot = bot
         self.db = self.bot.plugin_db.get_partition(self)
@@ -36,59 +299,282 @@ class SupportTimes(commands.Cog):
             "disable_schedules": [],
             "timezone": None,
             "log_actions": False,
+            "last_transition": None,
+            "exceptions": [],
+            "closed_responder": False,
         }
+        self.persisted_config = {}  # config as last written, to only write changed keys
+        self.config_flush = None
+        self.config_updates = 0
+        self.config_writes = 0
         self.schedules_loaded = False
-        self.enable_schedules = []
-        self.disable_schedules = []
+        self.engine = ScheduleEngine()
+        self.hours = None
+        self.hours_key = None
+        self.exceptions = ExceptionCalendar([])
+        self.exceptions_key = ()
+        self.closed_reply = None  # built once per transition or schedule change
+        self.responder_last = {}  # user id -> monotonic time of the last reply
 
     async def cog_load(self):
-        self.config = await self.db.find_one({"_id": "support-times"})
-        if self.config is None:
-            self.config = self.default_config
-            await self.update_config()
-        missing = []
-        for key in self.default_config.keys():
-            if key not in self.config:
-                missing.append(key)
+        for keys, options in self.db_indexes:
+            await self.db.create_index(keys, **options)
+        self.config = await self.db.find_one({"_id": "support-times"}) or {"_id": "support-times"}
+        self.persisted_config = copy.deepcopy(self.config)
+        missing = [key for key in self.default_config if key not in self.config]
+        for key in missing:
+            self.config[key] = copy.deepcopy(self.default_config[key])
         if missing:
-            for key in missing:
-                self.config[key] = self.default_config[key]
-        await self.update_config()
+            # Written right away, other nodes read the config on startup
+            self.config_updates += 1
+            await self.flush_config()
         await self.load_schedules_startup()
 
     async def cog_unload(self):
-        for i in self.enable_schedules:
-            i.stop()
-        for i in self.disable_schedules:
-            i.stop()
+        self.engine.stop()
+        if self.config_flush is not None:
+            self.config_flush.cancel()
+        await self.flush_config()
+
+    @property
+    def config_writes_saved(self) -> int:
+        return self.config_updates - self.config_writes
 
     async def update_config(self):
-        await self.db.find_one_and_update(
-            {"_id": "support-times"},
-            {"$set": self.config},
-            upsert=True,
-        )
+        """
+        Schedules writing the config.
+
+        Edits made within ``config_write_delay`` seconds are coalesced into one write,
+        which only sets the keys that changed since the last one.
+        """
+        self.config_updates += 1
+        if self.config_flush is None:
+            self.config_flush = asyncio.create_task(self.flush_config_later())
+
+    async def flush_config_later(self):
+        await asyncio.sleep(self.config_write_delay)
+        # Edits from here on schedule another write
+        self.config_flush = None
+        await self.flush_config()
+
+    async def flush_config(self):
+        changes = {
+            key: copy.deepcopy(value)
+            for key, value in self.config.items()
+            if key != "_id" and (key not in self.persisted_config or self.persisted_config[key] != value)
+        }
+        if not changes:
+            return
+        await self.db.update_one({"_id": "support-times"}, {"$set": changes}, upsert=True)
+        self.persisted_config.update(changes)
+        self.config_writes += 1
 
     async def load_schedules_startup(self):
         await self.bot.wait_until_ready()
         if self.schedules_loaded is False:
-            schedule_timezone = (
-                None if self.config["timezone"] is None else pytz.timezone(self.config["timezone"])
-            )
-            if not len(self.config["enable_schedules"]) == 0:
-                for i in self.config["enable_schedules"]:
-                    enable_scheduler = aiocron.crontab(
-                        i, func=self.enable_modmail, tz=schedule_timezone, start=True
-                    )
-                    self.enable_schedules.append(enable_scheduler)
-            if not len(self.config["disable_schedules"]) == 0:
-                for i in self.config["disable_schedules"]:
-                    disable_scheduler = aiocron.crontab(
-                        i, func=self.disable_modmail, tz=schedule_timezone, start=True
-                    )
-                    self.disable_schedules.append(disable_scheduler)
+            await self.update_schedules()
+            await self.catch_up()
+            self.engine.start()
             self.schedules_loaded = True
 
+    def next_exception_boundary(self, after: datetime) -> Optional[datetime]:
+        boundary = self.exceptions.next_boundary(after.timestamp())
+        return None if boundary is None else datetime.fromtimestamp(boundary, timezone.utc)
+
+    async def run_scheduled(self, opens: bool):
+        if self.exceptions.at(discord.utils.utcnow().timestamp()) is not None:
+            logger.info("Skipped a scheduled %s during an exception.", "enable" if opens else "disable")
+            return
+        await self.run_transition(opens)
+
+    async def run_exception_boundary(self):
+        # Entering an exception applies it, leaving one goes back to what the schedules say
+        await self.run_transition(self.is_open())
+
+    async def run_transition(self, opens: bool):
+        if opens:
+            await self.enable_modmail()
+        else:
+            await self.disable_modmail()
+        self.reset_closed_reply()
+        self.config["last_transition"] = discord.utils.utcnow().timestamp()
+        await self.update_config()
+
+    async def catch_up(self):
+        """
+        Applies the last scheduled transition if it happened while the bot was offline.
+
+        The transition is looked up in the precomputed weekly hours and compared with the
+        last one the plugin applied, so manual ``enable``/``disable`` changes made after
+        that are left alone.
+        """
+        now = discord.utils.utcnow()
+        previous = []
+        if self.hours is not None and self.hours.previous_transition(now) is not None:
+            previous.append(self.hours.previous_transition(now)[0].timestamp())
+        boundary = self.exceptions.previous_boundary(now.timestamp())
+        if boundary is not None:
+            previous.append(boundary)
+        if not previous:
+            return
+        when = datetime.fromtimestamp(max(previous), timezone.utc)
+        opens = self.is_open(now)
+        last = self.config["last_transition"]
+        if last is not None and last >= when.timestamp():
+            return
+        if opens != (self.bot.config["dm_disabled"] == DMDisabled.NONE):
+            logger.info(
+                "Missed the transition at %s while offline, %s ModMail now.",
+                when.isoformat(),
+                "enabling" if opens else "disabling",
+            )
+            if opens:
+                await self.enable_modmail()
+            else:
+                await self.disable_modmail()
+        self.config["last_transition"] = now.timestamp()
+        await self.update_config()
+
+    def simulate(self, start: datetime, end: datetime) -> list:
+        """
+        Returns the ``(when, opens, cron)`` fires of every schedule between ``start`` and ``end``.
+
+        ``when`` is a naive datetime in the schedule timezone. Fires are generated from the cached
+        weekly slots of each expression, repeated per week, so no cron expansion happens here;
+        expressions that don't repeat weekly are matched against each date once.
+        """
+        tz = self.schedule_timezone()
+        local_start = start.astimezone(tz).replace(tzinfo=None)
+        local_end = end.astimezone(tz).replace(tzinfo=None)
+        first_week = local_start.replace(hour=0, minute=0, second=0, microsecond=0) - timedelta(
+            days=local_start.weekday()
+        )
+        fires = []
+        for action, opens in (("enable", True), ("disable", False)):
+            for cron in self.config[f"{action}_schedules"]:
+                slots, weekly = cron_slots(cron)
+                if weekly:
+                    step, day_slots = timedelta(weeks=1), slots
+                else:
+                    # Those slots repeat the same minutes every day
+                    step, day_slots = timedelta(days=1), [slot for slot in slots if slot < MINUTES_PER_DAY]
+                day = first_week
+                while day < local_end:
+                    # The slots already match minute and hour, so one match per day settles
+                    # the day of month, month and weekday
+                    if weekly or croniter.croniter.match(cron, day + timedelta(minutes=day_slots[0])):
+                        for slot in day_slots:
+                            naive = day + timedelta(minutes=slot)
+                            if local_start <= naive < local_end:
+                                fires.append((naive, opens, cron))
+                    day += step
+        # At the same minute enables go first, so disables win like in the weekly hours
+        fires.sort(key=lambda fire: (fire[0], not fire[1]))
+        return fires
+
+    def analyze_schedules(self, start: datetime, end: datetime) -> tuple:
+        """
+        Simulates the schedules and returns ``(timeline, issues)``.
+
+        ``timeline`` lists ``(start, end, open)`` periods. ``issues`` maps a description of
+        each redundant, conflicting or overlapping fire to ``(first occurrence, count)``.
+        """
+        tz = self.schedule_timezone()
+        fires_by_minute = defaultdict(list)
+        for when, opens, cron in self.simulate(start, end):
+            fires_by_minute[when].append((opens, cron))
+        # Exception bounds in the same naive local time as the fires, so fires don't need localizing
+        bounds = [
+            datetime.fromtimestamp(bound, tz).replace(tzinfo=None) for bound in self.exceptions.bounds
+        ]
+        events = [(when, False, fires) for when, fires in fires_by_minute.items()]
+        events += [
+            (bound, True, None)
+            for bound, timestamp in zip(bounds, self.exceptions.bounds)
+            if start.timestamp() < timestamp < end.timestamp()
+        ]
+        events.sort(key=lambda event: event[:2])
+        state = self.is_open(start)
+        period_start = start
+        timeline = []
+        issues = {}
+
+        # Only fires that end up in the result get localized
+        def flag(description, when):
+            if description in issues:
+                first, count = issues[description]
+                issues[description] = (first, count + 1)
+            else:
+                issues[description] = (localize(when, tz), 1)
+
+        for when, is_boundary, fires in events:
+            if is_boundary:
+                when = localize(when, tz)
+                new_state = self.is_open(when)
+                if new_state != state:
+                    timeline.append((period_start, when, state))
+                    period_start, state = when, new_state
+                continue
+            segment = bisect.bisect_right(bounds, when) - 1
+            if 0 <= segment < len(self.exceptions.segments) and self.exceptions.segments[segment] is not None:
+                continue
+            for opens in (True, False):
+                crons = [cron for fire_opens, cron in fires if fire_opens == opens]
+                if len(crons) > 1:
+                    flag(f"Overlapping {('enable' if opens else 'disable')}s: ``{'``, ``'.join(crons)}``", when)
+            if len({opens for opens, _ in fires}) == 2:
+                flag(f"Conflict: ``{'``, ``'.join(cron for _, cron in fires)}`` enable and disable at once", when)
+            new_state = all(opens for opens, _ in fires)
+            if new_state == state:
+                crons = "``, ``".join(cron for opens, cron in fires if opens == new_state)
+                flag(f"Redundant: ``{crons}`` {('opens' if state else 'closes')} while already {('open' if state else 'closed')}", when)
+                continue
+            when = localize(when, tz)
+            timeline.append((period_start, when, state))
+            period_start, state = when, new_state
+        timeline.append((period_start, end, state))
+        return timeline, issues
+
+    def schedule_timezone(self):
+        return None if self.config["timezone"] is None else pytz.timezone(self.config["timezone"])
+
+    def is_open(self, at: datetime = None) -> bool:
+        """
+        Returns whether ModMail tickets are open at ``at`` (default: now) following the schedules and exceptions.
+
+        Without schedules, the current ``dm_disabled`` setting is used.
+        """
+        at = at or discord.utils.utcnow()
+        exception = self.exceptions.at(at.timestamp())
+        if exception is not None:
+            return exception["open"]
+        state = None if self.hours is None else self.hours.is_open(at)
+        if state is None:
+            return self.bot.config["dm_disabled"] == DMDisabled.NONE
+        return state
+
+    def next_transition(self, at: datetime = None) -> Optional[tuple]:
+        """Returns ``(when, opens)`` for the next scheduled opening or closing after ``at`` (default: now)."""
+        at = at or discord.utils.utcnow()
+        state = self.is_open(at)
+        # Every step either reaches the next exception boundary or, outside exceptions, a schedule
+        # change, which flips the state; boundaries that don't change anything are stepped over
+        while True:
+            candidates = []
+            # Inside an exception, schedule changes don't count until it ends
+            if self.exceptions.at(at.timestamp()) is None:
+                transition = None if self.hours is None else self.hours.next_transition(at)
+                if transition is not None:
+                    candidates.append(transition[0])
+            boundary = self.exceptions.next_boundary(at.timestamp())
+            if boundary is not None:
+                candidates.append(datetime.fromtimestamp(boundary, timezone.utc))
+            if not candidates:
+                return None
+            at = min(candidates)
+            if self.is_open(at) != state:
+                return at, not state
+
     def format_schedules(self, enable: list, disable: list):
         enabled_list = ["No schedules added"]
         disabled_list = ["No schedules added"]
@@ -109,27 +595,78 @@ class SupportTimes(commands.Cog):
         return enable_str, disable_str
 
     async def update_schedules(self):
-        for i in self.enable_schedules:
-            i.stop()
-        for i in self.disable_schedules:
-            i.stop()
-        self.enable_schedules.clear()
-        self.disable_schedules.clear()
-        schedule_timezone = (
-            None if self.config["timezone"] is None else pytz.timezone(self.config["timezone"])
+        """
+        Syncs the schedule engine with the configured schedules.
+
+        Jobs are keyed by action, cron and timezone, so only added or removed schedules
+        get re-armed; a timezone change re-arms all of them.
+        """
+        schedule_timezone = self.schedule_timezone()
+        hours_key = (
+            tuple(self.config["enable_schedules"]),
+            tuple(self.config["disable_schedules"]),
+            self.config["timezone"],
         )
-        if not len(self.config["enable_schedules"]) == 0:
-            for i in self.config["enable_schedules"]:
-                enable_scheduler = aiocron.crontab(
-                    i, func=self.enable_modmail, tz=schedule_timezone, start=True
+        if hours_key != self.hours_key:
+            self.hours = WeeklyHours(*hours_key[:2], schedule_timezone)
+            self.hours_key = hours_key
+            for cron in self.hours.skipped:
+                logger.warning("Schedule %s doesn't repeat weekly, is_open() won't account for it.", cron)
+        exceptions_key = tuple((e["start"], e["end"], e["open"]) for e in self.config["exceptions"])
+        if exceptions_key != self.exceptions_key:
+            self.exceptions = ExceptionCalendar(self.config["exceptions"])
+            self.exceptions_key = exceptions_key
+        jobs = {}
+        for action, opens in (("enable", True), ("disable", False)):
+            for cron in self.config[f"{action}_schedules"]:
+                jobs[(action, cron, self.config["timezone"])] = (
+                    cron_next_fire(cron, schedule_timezone),
+                    functools.partial(self.run_scheduled, opens),
                 )
-                self.enable_schedules.append(enable_scheduler)
-        if not len(self.config["disable_schedules"]) == 0:
-            for i in self.config["disable_schedules"]:
-                disable_scheduler = aiocron.crontab(
-                    i, func=self.disable_modmail, tz=schedule_timezone, start=True
+        if self.exceptions.bounds:
+            jobs[("exceptions", exceptions_key)] = (self.next_exception_boundary, self.run_exception_boundary)
+        self.engine.sync(jobs)
+        self.closed_reply = None
+
+    def reset_closed_reply(self):
+        # Cooldowns only matter while closed, so each transition starts them over
+        self.closed_reply = None
+        self.responder_last.clear()
+
+    def get_closed_reply(self) -> discord.Embed:
+        """Returns the closed-hours reply, built on first use after a transition or schedule change."""
+        if self.closed_reply is None:
+            description = "ModMail tickets are currently closed."
+            transition = None if self.is_open() else self.next_transition()
+            if transition is not None:
+                description += (
+                    f" They will open again {discord.utils.format_dt(transition[0], 'F')}"
+                    f" ({discord.utils.format_dt(transition[0], 'R')})."
                 )
-                self.disable_schedules.append(disable_scheduler)
+            self.closed_reply = discord.Embed(description=description, color=self.bot.error_color)
+        return self.closed_reply
+
+    @commands.Cog.listener()
+    async def on_message(self, message: discord.Message):
+        if message.guild is not None or message.author.bot:
+            return
+        now = time.monotonic()
+        last = self.responder_last.get(message.author.id)
+        if last is not None and now - last < self.responder_cooldown:
+            return
+        if self.config is None or not self.config["closed_responder"]:
+            return
+        dm_disabled = self.bot.config["dm_disabled"]
+        if dm_disabled == DMDisabled.NONE:
+            return
+        # Users with an open thread can still reply to it while only new threads are disabled
+        if dm_disabled == DMDisabled.NEW_THREADS and message.author.id in self.bot.threads.cache:
+            return
+        self.responder_last[message.author.id] = now
+        try:
+            await message.channel.send(embed=self.get_closed_reply())
+        except discord.HTTPException:
+            pass
 
     @checks.has_permissions(PermissionLevel.ADMINISTRATOR)
     @commands.group(name="support-times", invoke_without_command=True)
@@ -162,6 +699,11 @@ class SupportTimes(commands.Cog):
             "None (uses default system time)" if self.config["timezone"] is None else self.config["timezone"]
         )
         log_actions = "enabled" if self.config["log_actions"] is True else "disabled"
+        closed_responder = "enabled" if self.config["closed_responder"] is True else "disabled"
+        schedule_state = "open" if self.is_open() else "closed"
+        transition = self.next_transition()
+        if transition is not None:
+            schedule_state += f', {("opens" if transition[1] else "closes")} {discord.utils.format_dt(transition[0], "R")}'
         enable_schedules = self.config["enable_schedules"]
         disable_schedules = self.config["disable_schedules"]
 
@@ -171,6 +713,9 @@ class SupportTimes(commands.Cog):
             Disable Mode: ``{disable_mode}``
             Timezone: ``{configured_timezone}``   
             Log: ``{log_actions}``    
+            Closed Responder: ``{closed_responder}``
+            Schedule: {schedule_state}
+            Config writes saved: ``{self.config_writes_saved}``
             """,
             color=self.bot.main_color,
         )
@@ -182,6 +727,77 @@ class SupportTimes(commands.Cog):
 
         await ctx.send(embeds=[embed, embed2])
 
+    @checks.has_permissions(PermissionLevel.ADMINISTRATOR)
+    @support_times.command(name="preview", aliases=["simulate"])
+    async def support_times_preview(self, ctx: commands.Context, weeks: int = 4):
+        """
+        Previews when ModMail will be open or closed following the schedules.
+
+        Simulates all enable/disable schedules in the configured timezone for the next weeks
+        and flags redundant (e.g. two disables in a row), conflicting or overlapping schedules.
+
+        Examples:
+        - ``{prefix}support-times preview``
+        - ``{prefix}support-times preview 2``
+        """
+        if not 1 <= weeks <= 12:
+            embed = discord.Embed(
+                description="The preview can cover between 1 and 12 weeks.", color=self.bot.error_color
+            )
+            return await ctx.send(embed=embed)
+        start = discord.utils.utcnow()
+        end = start + timedelta(weeks=weeks)
+        timeline, issues = self.analyze_schedules(start, end)
+
+        open_minutes = sum((stop - begin).total_seconds() for begin, stop, state in timeline if state) / 60
+        issue_lines = [
+            f"- {description} (first {discord.utils.format_dt(first, 'f')}, {count}x)"
+            for description, (first, count) in issues.items()
+        ]
+        embed = discord.Embed(
+            title="Support-Times - Preview",
+            description=(
+                f"Next {weeks} week(s), {len(timeline) - 1} transition(s), "
+                f"open {open_minutes / 60:.1f}h of {weeks * 7 * 24}h.\n\n"
+                + ("**Issues:**\n" + "\n".join(issue_lines) if issue_lines else "No issues found.")
+            )[:4096],
+            color=self.bot.main_color,
+        )
+        embeds = [embed]
+        lines = [
+            f"{('🟢 Open' if state else '🔴 Closed')}: {discord.utils.format_dt(begin, 'f')} - {discord.utils.format_dt(stop, 'f')}"
+            for begin, stop, state in timeline
+        ]
+        for i in range(0, len(lines), 15):
+            embeds.append(
+                discord.Embed(
+                    title="Support-Times - Timeline",
+                    description="\n".join(lines[i : i + 15]),
+                    color=self.bot.main_color,
+                )
+            )
+        session = EmbedPaginatorSession(ctx, *embeds)
+        return await session.run()
+
+    @checks.has_permissions(PermissionLevel.ADMINISTRATOR)
+    @support_times.command(name="dbcheck")
+    async def support_times_dbcheck(self, ctx: commands.Context):
+        """
+        Explains the plugin's database queries and flags collection scans.
+        """
+        lines = []
+        for name, query in self.db_hot_queries:
+            plan = await self.db.find(query).explain()
+            stages = list(plan_stages(plan["queryPlanner"]["winningPlan"]))
+            flag = "\u26a0\ufe0f" if "COLLSCAN" in stages else "\u2705"
+            lines.append(f"{flag} {name}: ``{' <- '.join(stages)}``")
+        embed = discord.Embed(
+            title="Support-Times - Query Plans",
+            description="\n".join(lines),
+            color=self.bot.main_color,
+        )
+        return await ctx.send(embed=embed)
+
     @checks.has_permissions(PermissionLevel.ADMINISTRATOR)
     @support_times.command(name="scheduleadd", aliases=["addschedule", "add"])
     async def support_times_scheduleadd(self, ctx: commands.Context, mode: str = None, *, cron: str = None):
@@ -280,6 +896,133 @@ class SupportTimes(commands.Cog):
         )
         return await ctx.send(embed=embed)
 
+    def parse_exception_time(self, value: str, end: bool = False) -> Optional[float]:
+        """
+        Parses ``YYYY-MM-DD`` or ``YYYY-MM-DDTHH:MM`` in the schedule timezone, a date-only end covers the whole day.
+
+        Values with a UTC offset (``2026-12-24T10:00+01:00``) are taken as they are.
+        """
+        try:
+            naive = datetime.fromisoformat(value)
+        except ValueError:
+            return None
+        if naive.tzinfo is not None:
+            return naive.timestamp()
+        if end and "T" not in value and " " not in value:
+            naive += timedelta(days=1)
+        return localize(naive, self.schedule_timezone()).timestamp()
+
+    @checks.has_permissions(PermissionLevel.ADMINISTRATOR)
+    @support_times.command(name="exceptionadd", aliases=["addexception"])
+    async def support_times_exceptionadd(
+        self,
+        ctx: commands.Context,
+        state: str = None,
+        start: str = None,
+        end: str = None,
+        *,
+        note: str = None,
+    ):
+        """
+        Adds an exception that keeps ModMail open or closed for a date range, overriding the schedules.
+
+        Useful for public holidays, events or one-off opening hours.
+        Dates are ``YYYY-MM-DD`` (whole day) or ``YYYY-MM-DDTHH:MM`` in the configured timezone.
+        If exceptions overlap, the one added last wins.
+
+        Examples:
+        - ``{prefix}support-times exceptionadd closed 2026-12-24 2026-12-26 Christmas``
+        - ``{prefix}support-times exceptionadd open 2026-12-31T10:00 2026-12-31T14:00 New Year's Eve``
+        """
+        if state is None or start is None or end is None:
+            return await ctx.send_help(ctx.command)
+        state = state.lower()
+        if state not in ["open", "closed"]:
+            embed = discord.Embed(
+                description="The state needs to be ``open`` or ``closed``.", color=self.bot.error_color
+            )
+            return await ctx.send(embed=embed)
+        start_ts = self.parse_exception_time(start)
+        end_ts = self.parse_exception_time(end, end=True)
+        if start_ts is None or end_ts is None or end_ts <= start_ts:
+            embed = discord.Embed(
+                description="Invalid date range. Use ``YYYY-MM-DD`` or ``YYYY-MM-DDTHH:MM`` with the end after the start.",
+                color=self.bot.error_color,
+            )
+            return await ctx.send(embed=embed)
+        now = discord.utils.utcnow().timestamp()
+        # Past exceptions can't affect anything anymore
+        self.config["exceptions"] = [e for e in self.config["exceptions"] if e["end"] > now] + [
+            {"start": start_ts, "end": end_ts, "open": state == "open", "note": note}
+        ]
+        await self.update_config()
+        await self.update_schedules()
+        if start_ts <= now:
+            await self.run_transition(self.is_open())
+        logger.info("Exception from %s to %s has been added.", start, end)
+        embed = discord.Embed(
+            description=(
+                f"ModMail will be **{state}** from {discord.utils.format_dt(datetime.fromtimestamp(start_ts, timezone.utc), 'f')} "
+                f"until {discord.utils.format_dt(datetime.fromtimestamp(end_ts, timezone.utc), 'f')}."
+            ),
+            color=discord.Color.green(),
+        )
+        return await ctx.send(embed=embed)
+
+    @checks.has_permissions(PermissionLevel.ADMINISTRATOR)
+    @support_times.command(name="exceptionremove", aliases=["removeexception"])
+    async def support_times_exceptionremove(self, ctx: commands.Context, number: int = None):
+        """
+        Removes an exception.
+
+        The numbers of the exceptions can be viewed with ``{prefix}support-times exceptions``.
+
+        Examples:
+        - ``{prefix}support-times exceptionremove 1``
+        """
+        if number is None:
+            return await ctx.send_help(ctx.command)
+        if not 1 <= number <= len(self.config["exceptions"]):
+            embed = discord.Embed(description="The exception does not exist.", color=self.bot.error_color)
+            return await ctx.send(embed=embed)
+        exceptions = list(self.config["exceptions"])
+        removed = exceptions.pop(number - 1)
+        self.config["exceptions"] = exceptions
+        await self.update_config()
+        await self.update_schedules()
+        now = discord.utils.utcnow().timestamp()
+        if removed["start"] <= now < removed["end"]:
+            await self.run_transition(self.is_open())
+        logger.info("Exception %s has been removed.", number)
+        embed = discord.Embed(description=f"Successfully removed exception {number}!", color=discord.Color.green())
+        return await ctx.send(embed=embed)
+
+    @checks.has_permissions(PermissionLevel.ADMINISTRATOR)
+    @support_times.command(name="exceptions", aliases=["exceptionlist"])
+    async def support_times_exceptions(self, ctx: commands.Context):
+        """
+        Shows the exceptions overriding the schedules.
+        """
+        lines = []
+        for idx, exception in enumerate(self.config["exceptions"], start=1):
+            start = discord.utils.format_dt(datetime.fromtimestamp(exception["start"], timezone.utc), "f")
+            end = discord.utils.format_dt(datetime.fromtimestamp(exception["end"], timezone.utc), "f")
+            state = "open" if exception["open"] else "closed"
+            note = f" - {exception['note']}" if exception.get("note") else ""
+            lines.append(f"{idx}: **{state}** {start} - {end}{note}")
+        if not lines:
+            lines = ["No exceptions added"]
+        embeds = [
+            discord.Embed(
+                title="Support-Times - Exceptions",
+                description="\n".join(lines[i : i + 20]),
+                color=self.bot.main_color,
+            )
+            for i in range(0, len(lines), 20)
+        ]
+        session = EmbedPaginatorSession(ctx, *embeds)
+        return await session.run()
+
     @checks.has_permissions(PermissionLevel.ADMINISTRATOR)
     @support_times.command(name="mode")
     async def support_times_mode(self, ctx: commands.Context, mode: str = None):
@@ -397,6 +1140,35 @@ class SupportTimes(commands.Cog):
             embed.description += f"\nMake sure to set the config option ``log_channel_id``."
         return await ctx.send(embed=embed)
 
+    @checks.has_permissions(PermissionLevel.ADMINISTRATOR)
+    @support_times.command(name="responder", aliases=["closedresponder"])
+    async def support_times_responder(self, ctx: commands.Context, mode: bool = None):
+        """
+        Toggles the closed-hours responder (optional).
+
+        If enabled, users who DM the bot while ModMail tickets are disabled get a reply
+        with the time tickets open again following the schedules.
+        Each user gets at most one reply every 10 minutes.
+
+        Default:
+        False (disabled)
+
+        Examples:
+        - `{prefix}support-times responder True`
+        - `{prefix}support-times responder False`
+        """
+        if mode is None:
+            return await ctx.send_help(ctx.command)
+        self.config["closed_responder"] = mode
+        await self.update_config()
+        self.reset_closed_reply()
+        logger.info("Closed responder has been set %s.", mode)
+        embed = discord.Embed(
+            description=f'The closed-hours responder has been **{("enabled" if mode else "disabled")}**.',
+            color=discord.Color.green(),
+        )
+        return await ctx.send(embed=embed)
+
     async def enable_modmail(self):
         await self.bot.wait_until_ready()
         if self.bot.config["dm_disabled"] != DMDisabled.NONE:
@@ -0,0 +1,68 @@
+"""
+Tests for the schedule computations of support-times.
+
+Run them from the Modmail root directory so ``core`` is importable:
+
+    python -m pytest plugins/<owner>/<repo>/support-times-<branch>/test_support_times.py
+"""
+
+import importlib.util
+import sys
+from datetime import datetime, timedelta, timezone
+from pathlib import Path
+from types import SimpleNamespace
+
+import croniter
+import pytz
+
+sys.path.insert(0, ".")
+spec = importlib.util.spec_from_file_location("support_times", Path(__file__).with_name("support-times.py"))
+support_times = importlib.util.module_from_spec(spec)
+spec.loader.exec_module(support_times)
+
+
+def make_cog(enable, disable, exceptions=(), tz="UTC"):
+    """A cog with its schedules compiled, without a bot or database behind it."""
+    cog = support_times.SupportTimes.__new__(support_times.SupportTimes)
+    cog.bot = SimpleNamespace(config={"dm_disabled": support_times.DMDisabled.NONE})
+    cog.config = {
+        "enable_schedules": list(enable),
+        "disable_schedules": list(disable),
+        "timezone": tz,
+        "exceptions": list(exceptions),
+    }
+    cog.hours = support_times.WeeklyHours(enable, disable, pytz.timezone(tz))
+    cog.exceptions = support_times.ExceptionCalendar(list(exceptions))
+    return cog
+
+
+def test_next_transition_inside_long_exception():
+    start = datetime(2026, 12, 21, 12, tzinfo=timezone.utc)
+    end = start + timedelta(days=10)
+    cog = make_cog(["0 9 * * *"], ["0 17 * * *"], [{"start": start.timestamp(), "end": end.timestamp(), "open": False}])
+    at = start + timedelta(days=2)
+    assert cog.is_open(at) is False
+    # The schedules say open at noon, so support reopens right when the exception ends
+    assert cog.next_transition(at) == (end, True)
+
+
+def test_next_transition_after_long_exception_waits_for_schedule():
+    start = datetime(2026, 12, 21, 18, tzinfo=timezone.utc)
+    end = start + timedelta(days=10)
+    cog = make_cog(["0 9 * * *"], ["0 17 * * *"], [{"start": start.timestamp(), "end": end.timestamp(), "open": False}])
+    assert cog.next_transition(start + timedelta(days=3)) == (datetime(2027, 1, 1, 9, tzinfo=timezone.utc), True)
+
+
+def test_nth_weekday_schedule_matches_croniter():
+    cron = "0 8 * * 5#2"
+    assert support_times.cron_slots(cron)[1] is False
+    cog = make_cog([cron], ["0 17 * * *"])
+    assert cron in cog.hours.skipped
+
+    start, end = datetime(2026, 10, 1), datetime(2027, 1, 1)
+    expected = []
+    walk = croniter.croniter(cron, start - timedelta(minutes=1))
+    while (fire := walk.get_next(datetime)) < end:
+        expected.append(fire)
+    fires = cog.simulate(start.replace(tzinfo=timezone.utc), end.replace(tzinfo=timezone.utc))
+    assert [when for when, opens, _ in fires if opens] == expected